@@ -7,6 +7,7 @@ from math import gamma
 from scipy import stats
 
 from hyperparameters import bayesian_initialzpd_start
+from lazy_log import lazy_items, lazy_mapping
 
 logger = logging.getLogger(f"zpd.{__name__}")
 logger.setLevel(logging.DEBUG)
@@ -112,10 +113,8 @@ def bayesian_initialzpd(progression_graph,
         updated_progression_graph[trace] = progression
     progression_graph = updated_progression_graph
 
-    log = f"Generated trace node dict: "
-    for trace, node in trace_node_dict.items():
-        log += f"\n{trace} -> Node {node}"
-    logger.info(log)
+    logger.info("%s", lazy_mapping("Generated trace node dict: ",
+                                   trace_node_dict, "\n{} -> Node {}"))
 
     # # Compute prior probability of answering for each trace.
     # for trace in progression_graph.keys():
@@ -131,7 +130,7 @@ def bayesian_initialzpd(progression_graph,
     for trace, problems in trace_problems_dict.items():
         trace_problemsIter_dict[trace] = iter(problems)
     
-    logger.info(f"Generated iters.")
+    logger.info("Generated iters.")
 
     # Generate answers.
     answers = defaultdict(list)
@@ -146,10 +145,7 @@ def bayesian_initialzpd(progression_graph,
             result = student.solve(chosen_problem)
             answers[trace].append(result == get_solution(chosen_problem))
     
-    log = f"Recorded answers: "
-    for trace, result in answers.items():
-        log += f"\n{trace} -> {result}"
-    logger.info(log)
+    logger.info("%s", lazy_mapping("Recorded answers: ", answers))
 
     # # Calculate likelihood.
     # trace_likelihood_dict = {}
@@ -203,9 +199,9 @@ def bayesian_initialzpd(progression_graph,
                 node.known = True
             updated_dependency_prob_dict[dependency] = posterior
 
-            log = (f"Bayesian Update: {dependency} --> {trace}, Prior:{prior},"
-                   f"Likelihood: {likelihood}, Posterior: {posterior}")
-            logger.info(log)
+            logger.info("Bayesian Update: %s --> %s, Prior:%s,Likelihood: %s, "
+                        "Posterior: %s", dependency, trace, p, likelihood,
+                        posterior)
 
         node.dependency_prob_dict = updated_dependency_prob_dict
 
@@ -220,9 +216,6 @@ def bayesian_initialzpd(progression_graph,
     if not init_zpd:
         init_zpd = set(progression_graph[bayesian_initialzpd_start])
 
-    log = f"Generated initial zpd: "
-    for trace in init_zpd:
-        log += f"\n{trace}"
-    logger.info(log)
+    logger.info("%s", lazy_items("Generated initial zpd: ", init_zpd))
 
     return init_zpd
\ No newline at end of file
@@ -1,4 +1,101 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from multiprocessing import Pool
+
+import numpy as np
+
 from hyperparameters import ngram_size
+from trace_encoding import encode_trace, decode_trace, packed_length, \
+    packed_ngrams, packed_contains
+
+# Number of distinct pieces of at most ngram_size actions, i.e. of bits in a
+# signature.
+n_signature_bits = (pow(4, ngram_size + 1) - 1) // 3
+
+# Caches from trace, and packed trace, to its n-gram bitmask signature.
+trace_signature_dict = {}
+packed_trace_signature_dict = {}
+
+
+def split(trace):
+    """
+    Function takes a trace and splits it into n sized contiguous pieces.
+
+    Parameter(s):
+        trace: string
+
+    Returns:
+        n_grams: set(string)
+    """
+    n_grams = set()
+    if len(trace) < ngram_size:
+        n_grams.add(trace)
+    else:
+        for i in range(len(trace) - ngram_size + 1):
+            n_grams.add(trace[i:i + ngram_size])
+
+    return n_grams
+
+
+def ngram_bit(code):
+    """
+    Function takes a packed n-gram, of at most ngram_size actions, and returns
+    its bit position in a signature. Pieces of each length get their own
+    contiguous range of positions.
+
+    Parameter(s):
+        code: int
+
+    Returns:
+        bit: int
+    """
+    length = packed_length(code)
+
+    return (pow(4, length) - 1) // 3 + (code ^ (1 << 2 * length))
+
+
+def ngram_signature(trace):
+    """
+    Function takes a trace and returns the set of its n-grams as an integer
+    bitmask, so that set inclusion becomes a bitwise test. Signatures are
+    computed once per trace and cached.
+
+    Parameter(s):
+        trace: string
+
+    Returns:
+        signature: int
+    """
+    signature = trace_signature_dict.get(trace)
+    if signature is None:
+        signature = 0
+        for n_gram in split(trace):
+            signature |= 1 << ngram_bit(encode_trace(n_gram))
+        trace_signature_dict[trace] = signature
+
+    return signature
+
+
+def packed_ngram_signature(code):
+    """
+    Counterpart of ngram_signature for traces packed with
+    trace_encoding.encode_trace.
+
+    Parameter(s):
+        code: int
+
+    Returns:
+        signature: int
+    """
+    signature = packed_trace_signature_dict.get(code)
+    if signature is None:
+        signature = 0
+        for n_gram in packed_ngrams(code):
+            signature |= 1 << ngram_bit(n_gram)
+        packed_trace_signature_dict[code] = signature
+
+    return signature
+
 
 def atleast_complex(t1, t2):
     """
@@ -6,40 +103,16 @@ def atleast_complex(t1, t2):
     otherwise False
     """
 
-    def split(trace):
-        """
-        Function takes a trace and splits it into n sized contiguous pieces.
-
-        Parameter(s):
-            trace: string
-            n: int
-
-        Returns:
-            n_grams: set(string)
-        """
-        n_grams = set()
-        if len(trace) < ngram_size:
-            n_grams.add(trace)
-        else:
-            for i in range(len(trace) - ngram_size + 1):
-                n_grams.add(trace[i:i + ngram_size])
-        
-        return n_grams
-
-    t1_ngrams = split(t1)
-    t2_ngrams = split(t2)
+    t1_signature = ngram_signature(t1)
+    t2_signature = ngram_signature(t2)
     
     result = False
     
-    # Condition corresponding t1 being as complex as t2
-    if t1_ngrams == t2_ngrams:
+    # Condition corresponding t1 being as complex as t2, i.e. t1's ngrams
+    # being equal to or a superset of t2's ngrams.
+    if t1_signature & t2_signature == t2_signature:
         result = True
     
-    # Condition corresponding to t1's ngrams being a strict
-    # superset of t2's ngrams
-    elif t1_ngrams.issuperset(t2_ngrams):
-        result = True  
-    
     # Condition corresponding to t1 and t2 being smaller than the
     # the ngram_size parameter but t1 is contiguous sequence in t2.
     elif t1 not in t2 and t2 in t1:
@@ -73,3 +146,369 @@ def cmp_trace(t1, t2):
         result = 0
 
     return result
+
+
+def atleast_complex_packed(c1, c2):
+    """
+    Counterpart of atleast_complex for traces packed with
+    trace_encoding.encode_trace. Returns True if c1 >= c2, otherwise False.
+    """
+    c1_signature = packed_ngram_signature(c1)
+    c2_signature = packed_ngram_signature(c2)
+
+    return (c1_signature & c2_signature == c2_signature or
+            (not packed_contains(c2, c1) and packed_contains(c1, c2)))
+
+
+def cmp_trace_packed(c1, c2):
+    """
+    Counterpart of cmp_trace for traces packed with
+    trace_encoding.encode_trace.
+
+    Parameter(s):
+        c1: int
+        c2: int
+
+    Returns:
+        result: int (1, 0, -1)
+    """
+
+    c1_ge_c2 = atleast_complex_packed(c1, c2)
+    c2_ge_c1 = atleast_complex_packed(c2, c1)
+
+    if c1_ge_c2 == c2_ge_c1:
+        result = 0
+    elif c1_ge_c2:
+        result = 1
+    else:
+        result = -1
+
+    return result
+
+
+class SubstringIndex():
+    """
+    Class for a suffix index over a set of traces, built once per curriculum,
+    answering which traces contain a given trace as a contiguous piece.
+    """
+
+    def __init__(self, traces):
+        # Sorted suffixes of all traces, the empty suffix included, along with
+        # the index of the trace each one belongs to. The suffixes starting
+        # with a given trace are then one contiguous range.
+        suffixes = sorted((t[i:], k)
+                          for k, t in enumerate(traces)
+                          for i in range(len(t) + 1))
+        self.suffixes = [suffix for suffix, _ in suffixes]
+        self.trace_indices = [k for _, k in suffixes]
+
+    def containing(self, trace):
+        """
+        Function that returns the indices of the traces containing trace, in
+        time proportional to the number of its occurrences.
+
+        Parameter(s):
+            trace: string
+
+        Returns:
+            indices: set(int)
+        """
+        start = bisect_left(self.suffixes, trace)
+        end = bisect_right(self.suffixes, trace + chr(0x10ffff), start)
+
+        return set(self.trace_indices[start:end])
+
+    def __repr__(self):
+        return f"SubstringIndex(n_suffixes={len(self.suffixes)})"
+
+
+def ngram_incidence_matrix(traces):
+    """
+    Function takes N traces and returns their trace-by-n-gram incidence
+    matrix, row i being the signature of traces[i] unpacked into bits.
+
+    Parameter(s):
+        traces: list(string) or list(int), packed traces being accepted too.
+
+    Returns:
+        incidence: np.ndarray(uint8, shape=(N, n_signature_bits))
+    """
+    signature = (packed_ngram_signature if traces and
+                 isinstance(traces[0], int) else ngram_signature)
+
+    return signature_incidence_matrix([signature(t) for t in traces])
+
+
+def signature_incidence_matrix(signatures):
+    """
+    Function that unpacks N signatures into an incidence matrix.
+
+    Parameter(s):
+        signatures: list(int)
+
+    Returns:
+        incidence: np.ndarray(uint8, shape=(N, n_signature_bits))
+    """
+    n_bytes = (n_signature_bits + 7) // 8
+    buffer = b"".join(s.to_bytes(n_bytes, "little") for s in signatures)
+    bits = np.unpackbits(np.frombuffer(buffer, dtype=np.uint8))
+    # unpackbits is most significant bit first within each byte.
+    bits = bits.reshape(len(signatures), n_bytes, 8)[:, :, ::-1]
+
+    return bits.reshape(len(signatures), -1)[:, :n_signature_bits]
+
+
+def complexity_matrix(traces):
+    """
+    Function takes N traces and returns the N x N matrix of the
+    atleast_complex relation, matrix[i, j] being atleast_complex(traces[i],
+    traces[j]). The n-gram superset tests run as one matrix product over the
+    incidence matrix.
+
+    Parameter(s):
+        traces: list(string) or list(int), packed traces being accepted too.
+
+    Returns:
+        matrix: np.ndarray(bool, shape=(N, N))
+    """
+    incidence = ngram_incidence_matrix(traces).astype(np.float32)
+    if traces and isinstance(traces[0], int):
+        traces = [decode_trace(t) for t in traces]
+
+    # traces[i] is at least as complex as traces[j] when none of the n-grams
+    # of traces[j] is missing from traces[i].
+    missing = np.dot(1 - incidence, incidence.T)
+    matrix = missing == 0
+
+    for j, supersets in substring_rule_supersets(traces).items():
+        matrix[list(supersets), j] = True
+
+    return matrix
+
+
+def substring_rule_supersets(traces):
+    """
+    Function that applies the substring rule of atleast_complex in bulk. The
+    rule only adds pairs where the contained trace is shorter than
+    ngram_size, a longer one has its n-grams in the containing trace anyway.
+    A trace contained in a short trace is short too.
+
+    Parameter(s):
+        traces: list(string)
+
+    Returns:
+        short_supersets_dict: dict(int -> set(int)), for every short trace
+            the traces at least as complex as it by the substring rule.
+    """
+    index = SubstringIndex(traces)
+    short = [j for j, t in enumerate(traces) if len(t) < ngram_size]
+
+    short_supersets_dict = {}
+    for j in short:
+        supersets = index.containing(traces[j])
+        supersets.difference_update(k for k in short
+                                    if traces[k] in traces[j])
+        short_supersets_dict[j] = supersets
+
+    return short_supersets_dict
+
+
+def cmp_matrix(traces):
+    """
+    Function takes N traces and returns the N x N matrix of the cmp_trace
+    relation, matrix[i, j] being cmp_trace(traces[i], traces[j]).
+
+    Parameter(s):
+        traces: list(string) or list(int), packed traces being accepted too.
+
+    Returns:
+        matrix: np.ndarray(int8, shape=(N, N))
+    """
+    at_least = complexity_matrix(traces).astype(np.int8)
+
+    return at_least - at_least.T
+
+
+def signature_bits(signature):
+    """
+    Generator that yields the positions of the set bits of a signature.
+
+    Parameter(s):
+        signature: int
+
+    Yields:
+        bit: int
+    """
+    while signature:
+        low = signature & -signature
+        yield low.bit_length() - 1
+        signature ^= low
+
+
+def signature_classes(traces):
+    """
+    Function that groups traces by their n-gram signature. The short pieces of
+    a trace at least ngram_size long all lie in its n-grams, so traces with
+    the same signature compare the same way with every trace.
+
+    Parameter(s):
+        traces: list(string) or list(int), packed traces being accepted too.
+
+    Returns:
+        classes: np.ndarray(int, shape=(N,)), the class of every trace.
+        representatives: list(int), the index of one trace per class.
+    """
+    signature = (packed_ngram_signature if traces and
+                 isinstance(traces[0], int) else ngram_signature)
+    signature_class_dict = {}
+    classes = np.empty(len(traces), dtype=np.int64)
+    representatives = []
+    for i, trace in enumerate(traces):
+        s = signature(trace)
+        if s not in signature_class_dict:
+            signature_class_dict[s] = len(representatives)
+            representatives.append(i)
+        classes[i] = signature_class_dict[s]
+
+    return classes, representatives
+
+
+def more_complex_classes(traces, n_workers=1):
+    """
+    Function takes N traces, groups them with signature_classes and returns,
+    for every class, the classes strictly more complex than it according to
+    cmp_trace. Candidates come from an inverted index from each n-gram to the
+    classes containing it: the classes at least as complex as a class are the
+    intersection of the postings of its n-grams, plus the classes found by
+    the substring rule for short traces, so incomparable pairs are never
+    tested. With n_workers > 1 the intersections are split into blocks of
+    classes across a process pool, see at_least_complex_parallel.
+
+    Parameter(s):
+        traces: list(string) or list(int), packed traces being accepted too.
+        n_workers: int
+
+    Returns:
+        classes: np.ndarray(int, shape=(N,)), the class of every trace.
+        more_complex: list(set(int)), for every class the classes strictly
+            more complex than it.
+    """
+    classes, representatives = signature_classes(traces)
+    if traces and isinstance(traces[0], int):
+        signatures = [packed_ngram_signature(traces[r])
+                      for r in representatives]
+        representatives = [decode_trace(traces[r]) for r in representatives]
+    else:
+        representatives = [traces[r] for r in representatives]
+        signatures = [ngram_signature(t) for t in representatives]
+
+    if n_workers > 1:
+        at_least_complex = at_least_complex_parallel(signatures, n_workers)
+    else:
+        bit_classes_dict = ngram_postings(signatures)
+        at_least_complex = [postings_intersection(signature, bit_classes_dict)
+                            for signature in signatures]
+
+    for c, supersets in substring_rule_supersets(representatives).items():
+        at_least_complex[c] |= supersets
+
+    more_complex = [{d for d in at_least if c not in at_least_complex[d]}
+                    for c, at_least in enumerate(at_least_complex)]
+
+    return classes, more_complex
+
+
+def ngram_postings(signatures):
+    """
+    Function that builds the inverted index from every n-gram bit to the
+    classes whose signature contains it.
+
+    Parameter(s):
+        signatures: list(int)
+
+    Returns:
+        bit_classes_dict: dict(int -> set(int))
+    """
+    bit_classes_dict = defaultdict(set)
+    for c, signature in enumerate(signatures):
+        for bit in signature_bits(signature):
+            bit_classes_dict[bit].add(c)
+
+    return bit_classes_dict
+
+
+def postings_intersection(signature, bit_classes_dict):
+    """
+    Function that returns the classes containing every n-gram of signature,
+    intersecting the postings of its n-grams shortest first.
+
+    Parameter(s):
+        signature: int
+        bit_classes_dict: dict(int -> set(int)), see ngram_postings.
+
+    Returns:
+        at_least_complex: set(int)
+    """
+    postings = sorted((bit_classes_dict[bit]
+                       for bit in signature_bits(signature)), key=len)
+
+    return set.intersection(*postings)
+
+
+# Class signatures and their inverted index, built once in every pool worker
+# of at_least_complex_parallel.
+worker_signatures = None
+worker_postings = None
+
+
+def init_postings_worker(signatures):
+    """
+    Pool initializer that builds the inverted index of a worker.
+    """
+    global worker_signatures, worker_postings
+    worker_signatures = signatures
+    worker_postings = ngram_postings(signatures)
+
+
+def at_least_complex_block(block):
+    """
+    Function run by the pool workers of at_least_complex_parallel. For every
+    class in the block it intersects the postings of its n-grams.
+
+    Parameter(s):
+        block: tuple(int, int), the first and past the last class.
+
+    Returns:
+        at_least_complex: list(set(int)), for every class in the block the
+            classes with all its n-grams.
+    """
+    return [postings_intersection(worker_signatures[c], worker_postings)
+            for c in range(*block)]
+
+
+def at_least_complex_parallel(signatures, n_workers):
+    """
+    Function that finds, for every signature, the signatures including it
+    across a pool of n_workers processes. The signatures are sent to each
+    worker once, which builds its own inverted index, and each worker
+    intersects postings for blocks of classes.
+
+    Parameter(s):
+        signatures: list(int)
+        n_workers: int
+
+    Returns:
+        at_least_complex: list(set(int))
+    """
+    block_size = max(1, -(-len(signatures) // (4 * n_workers)))
+    blocks = [(start, min(start + block_size, len(signatures)))
+              for start in range(0, len(signatures), block_size)]
+
+    with Pool(n_workers,
+              initializer=init_postings_worker,
+              initargs=(signatures,)) as pool:
+        block_results = pool.map(at_least_complex_block, blocks)
+
+    return [supersets
+            for block_result in block_results
+            for supersets in block_result]
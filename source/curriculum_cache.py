@@ -0,0 +1,171 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+import compare_traces
+import curriculum_store
+import generate_curriculum
+import generate_trace
+import reachability
+import trace_encoding
+from curriculum_store import save_curriculum, load_curriculum
+from hyperparameters import curriculum_cache_dir, curriculum_cache_max_bytes, \
+    curriculum_cache_max_age
+
+logger = logging.getLogger(f"zpd.{__name__}")
+logger.setLevel(logging.DEBUG)
+
+# Modules whose code determines the generated traces and curriculum.
+generation_modules = (generate_trace, compare_traces, trace_encoding,
+                      generate_curriculum, curriculum_store, reachability)
+
+
+def code_version():
+    """
+    Function that returns a hash of the source of the generation modules, so
+    that cache entries are not reused after the generation code changes.
+
+    Returns:
+        version: string
+    """
+    digest = hashlib.sha256()
+    for module in generation_modules:
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+def curriculum_cache_key(inputs):
+    """
+    Function that returns the content address of a curriculum, a hash of its
+    generation inputs and of the generation code.
+
+    Parameter(s):
+        inputs: dict(string -> json serialisable object)
+
+    Returns:
+        key: string
+    """
+    blob = json.dumps({"inputs": inputs, "code": code_version()},
+                      sort_keys=True,
+                      default=str)
+
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def cached_curriculum(build,
+                      inputs,
+                      cache_dir=curriculum_cache_dir,
+                      on_hit=None):
+    """
+    Function that returns the curriculum generated from inputs, from the
+    cache when an entry for the same inputs and generation code exists, and
+    otherwise by calling build and storing its result. Without a seed in
+    inputs the curriculum is random, so it is always built again and its
+    entry replaced. When concurrent runs build the same entry, the first one
+    moved in is kept and returned to all of them. On a hit build is not
+    called, so on_hit is called with the curriculum instead, e.g. to write
+    the side outputs build would have written.
+
+    Parameter(s):
+        build: function(-> (dict(string -> list(string)),
+            dict(string -> list(tuple(int, int, int, string)))))
+        inputs: dict(string -> json serialisable object)
+        cache_dir: string
+        on_hit: function(curriculum_store.Curriculum ->) or None
+
+    Returns:
+        curriculum: curriculum_store.Curriculum
+    """
+    key = curriculum_cache_key(inputs)
+    entry_dir = os.path.join(cache_dir, key)
+
+    if inputs.get("seed") is not None and os.path.isdir(entry_dir):
+        logger.info(f"Curriculum cache hit {key}.")
+        # Mark the entry as recently used for eviction.
+        os.utime(entry_dir)
+        curriculum = load_curriculum(entry_dir)
+        if on_hit is not None:
+            on_hit(curriculum)
+        return curriculum
+
+    logger.info(f"Curriculum cache miss {key}.")
+    progression_graph, trace_problems_dict = build()
+
+    # Write the entry next to its final place and move it in at once, so a
+    # crashed run never leaves a partial entry behind.
+    os.makedirs(cache_dir, exist_ok=True)
+    partial_dir = f"{entry_dir}.{os.getpid()}.partial"
+    save_curriculum(partial_dir, progression_graph, trace_problems_dict)
+
+    # A replaced entry is moved aside in one step rather than deleted in
+    # place, and deleted once the new one is in. Runs that mapped its files
+    # keep reading them.
+    stale_dir = f"{entry_dir}.{os.getpid()}.stale"
+    if inputs.get("seed") is None and os.path.isdir(entry_dir):
+        try:
+            os.rename(entry_dir, stale_dir)
+        except OSError:
+            pass
+    try:
+        os.replace(partial_dir, entry_dir)
+    except OSError:
+        # A concurrent run moved its entry in first, use that one.
+        logger.info(f"Curriculum cache entry {key} written concurrently.")
+        shutil.rmtree(partial_dir, ignore_errors=True)
+    shutil.rmtree(stale_dir, ignore_errors=True)
+
+    evict_curricula(cache_dir, keep=entry_dir)
+
+    return load_curriculum(entry_dir)
+
+
+def evict_curricula(cache_dir=curriculum_cache_dir,
+                    max_bytes=curriculum_cache_max_bytes,
+                    max_age=curriculum_cache_max_age,
+                    keep=None):
+    """
+    Function that removes the cache entries not used for max_age seconds and
+    then the least recently used ones until the cache fits in max_bytes. The
+    entry at keep, the one just written, is never removed, even when it
+    alone does not fit.
+
+    Parameter(s):
+        cache_dir: string
+        max_bytes: int
+        max_age: float
+        keep: string or None
+
+    Returns:
+        None
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if (name.endswith((".partial", ".stale"))
+            or not os.path.isdir(path)):
+            continue
+        # Entries can hold derived artifacts in subdirectories.
+        size = sum(os.path.getsize(os.path.join(root, f))
+                   for root, _, files in os.walk(path)
+                   for f in files)
+        entries.append((os.path.getmtime(path), size, path))
+
+    # Oldest first.
+    entries.sort()
+    total_bytes = sum(size for _, size, _ in entries)
+    now = time.time()
+    for used, size, path in entries:
+        if now - used <= max_age and total_bytes <= max_bytes:
+            break
+        if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total_bytes -= size
+        logger.info(f"Evicted curriculum cache entry {path}.")
+
+    return None
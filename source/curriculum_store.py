@@ -0,0 +1,201 @@
+from collections.abc import Mapping
+import logging
+import os
+
+import numpy as np
+
+from reachability import ReachabilityIndex, levelized_order, \
+    progression_csr
+
+logger = logging.getLogger(f"zpd.{__name__}")
+logger.setLevel(logging.DEBUG)
+
+# Arrays making up a curriculum artifact, each stored as <name>.npy.
+curriculum_arrays = ("traces", "indptr", "indices", "problems", "offsets",
+                     "order", "levels")
+
+
+def problem_column_dtype(values):
+    """
+    Function that returns the dtype of a problem column, int64 unless some
+    value does not fit, in which case fixed width decimal strings.
+
+    Parameter(s):
+        values: list(int)
+
+    Returns:
+        dtype: np.dtype
+    """
+    limit = np.iinfo(np.int64).max
+    if all(-limit <= v <= limit for v in values):
+        return np.dtype(np.int64)
+
+    return np.dtype(f"S{max(len(str(v)) for v in values)}")
+
+
+def save_curriculum(curriculum_dir, progression_graph, trace_problems_dict):
+    """
+    Function that writes a curriculum as a binary artifact: interned trace
+    IDs, the progression graph as a CSR adjacency (indptr, indices) and one
+    structured array of problems sorted by trace with per-trace offsets. The
+    levelized topological order of the graph is computed here and stored
+    with it, so estimators can break ties by rank instead of sorting.
+    Every array is a .npy file, so load_curriculum can memory map them.
+
+    Parameter(s):
+        curriculum_dir: string
+        progression_graph: dict(string -> list(string))
+        trace_problems_dict: dict(string -> list(tuple(int, int, int, string)))
+
+    Returns:
+        None
+    """
+    traces, indptr, indices = progression_csr(progression_graph)
+
+    offsets = np.zeros(len(traces) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(trace_problems_dict.get(t, ()))
+                             for t in traces])
+    rows = [problem
+            for trace in traces
+            for problem in trace_problems_dict.get(trace, ())]
+    columns = list(zip(*rows)) if rows else [(), (), ()]
+    dtype = [(name, problem_column_dtype(values) if values else np.int64)
+             for name, values in zip(("operand1", "operand2", "sum"),
+                                     columns)]
+    problems = np.zeros(len(rows), dtype=dtype + [("trace", np.int32)])
+    for name, values in zip(("operand1", "operand2", "sum"), columns):
+        if problems.dtype[name].kind == "S":
+            values = [str(v) for v in values]
+        problems[name] = values
+    problems["trace"] = np.repeat(np.arange(len(traces), dtype=np.int32),
+                                  np.diff(offsets))
+
+    order, levels = levelized_order(indptr, indices)
+
+    width = max([1] + [len(t) for t in traces])
+    arrays = {"traces": np.array(traces, dtype=f"S{width}"),
+              "indptr": indptr,
+              "indices": indices,
+              "problems": problems,
+              "offsets": offsets,
+              "order": order,
+              "levels": levels}
+
+    os.makedirs(curriculum_dir, exist_ok=True)
+    for name in curriculum_arrays:
+        np.save(os.path.join(curriculum_dir, f"{name}.npy"), arrays[name])
+
+    log = (f"Saved curriculum of {len(traces)} traces and {len(rows)} "
+           f"problems to {curriculum_dir}.")
+    logger.info(log)
+
+    return None
+
+
+def load_curriculum(curriculum_dir):
+    """
+    Function that memory maps a curriculum written by save_curriculum. Pages
+    are read on demand and shared between processes mapping the same files.
+
+    Parameter(s):
+        curriculum_dir: string
+
+    Returns:
+        curriculum: Curriculum
+    """
+    arrays = {name: np.load(os.path.join(curriculum_dir, f"{name}.npy"),
+                            mmap_mode="r")
+              for name in curriculum_arrays}
+
+    curriculum = Curriculum(**arrays)
+    curriculum.directory = curriculum_dir
+
+    return curriculum
+
+
+class Curriculum():
+    """
+    Class for a curriculum loaded from its binary artifact. progression_graph
+    and trace_problems_dict are read-only mappings with the same contents as
+    the dictionaries generate_curriculum returns, built per trace on access.
+    """
+
+    def __init__(self, traces, indptr, indices, problems, offsets, order,
+                 levels):
+        self.traces = [t.decode() for t in traces.tolist()]
+        self.trace_id_dict = {t: i for i, t in enumerate(self.traces)}
+        self.indptr = indptr
+        self.indices = indices
+        self.problems = problems
+        self.offsets = offsets
+        self.order = order
+        self.levels = levels
+        self.progression_graph = CurriculumView(self, self.progression)
+        self.trace_problems_dict = CurriculumView(self, self.trace_problems)
+        self.reachability = None
+        # Directory of the artifact, where derived artifacts such as
+        # placement trees are stored with it.
+        self.directory = None
+
+    def progression(self, trace):
+        """
+        Function that returns the traces following trace in the progression.
+        """
+        i = self.trace_id_dict[trace]
+        indices = self.indices[self.indptr[i]:self.indptr[i + 1]]
+        return [self.traces[j] for j in indices.tolist()]
+
+    def trace_problems(self, trace):
+        """
+        Function that returns the problems of trace as (operand1, operand2,
+        sum, trace) tuples.
+        """
+        i = self.trace_id_dict[trace]
+        problems = self.problems[self.offsets[i]:self.offsets[i + 1]]
+        return [(int(op1), int(op2), int(result), trace)
+                for op1, op2, result, _ in problems.tolist()]
+
+    def reachability_index(self):
+        """
+        Function that returns the reachability index of the progression
+        graph, built on first use and shared by every later caller.
+        """
+        if self.reachability is None:
+            self.reachability = ReachabilityIndex(self.traces,
+                                                  self.indptr,
+                                                  self.indices,
+                                                  self.order,
+                                                  self.levels)
+        return self.reachability
+
+    def __repr__(self):
+        return (f"Curriculum(n_traces={len(self.traces)}, "
+                f"n_problems={len(self.problems)})")
+
+
+class CurriculumView(Mapping):
+    """
+    Class for a read-only trace keyed mapping over a Curriculum, caching the
+    values it has built.
+    """
+
+    def __init__(self, curriculum, get_value):
+        self.curriculum = curriculum
+        self.get_value = get_value
+        self.cache = {}
+
+    def __getitem__(self, trace):
+        value = self.cache.get(trace)
+        if value is None:
+            value = self.get_value(trace)
+            self.cache[trace] = value
+        return value
+
+    def __iter__(self):
+        return iter(self.curriculum.traces)
+
+    def __len__(self):
+        return len(self.curriculum.traces)
+
+    def __contains__(self, trace):
+        return trace in self.curriculum.trace_id_dict
@@ -1,14 +1,20 @@
+import atexit
 import time
 import logging
 from datetime import datetime
-import json
 
 from copy import deepcopy
-from generate_trace import generate_2digitaddition_traces
-from generate_curriculum import generate_curriculum
-from compare_traces import cmp_trace
+from generate_trace import iter_2digitaddition_traces, \
+    iter_2digitaddition_catalog
+from generate_curriculum import generate_curriculum_from_rows, \
+    write_curriculum_files
+from curriculum_cache import cached_curriculum
+from compare_traces import cmp_trace, more_complex_classes
 from kl_ucb_zpd import kl_ucb_zpd
 from hyperparameters import ndigit_n_dict, trace_file, progression_graph_file, \
+    trace_catalog_ndigits, problems_per_trace, trace_seed, trace_workers, \
+    trace_shard_size, progression_workers, \
+    ngram_size, action_tag_dict, log_file, \
     trace_problems_file, init_zpd_entropy_threshold, \
     init_zpd_regularisation_0, zpdes_beta, zpdes_eta, \
     zpdes_d, zpdes_h, zpdes_initial_weight, zpdes_gamma, \
@@ -20,15 +26,18 @@ from hyperparameters import ndigit_n_dict, trace_file, progression_graph_file, \
     kl_ucb_p_threshold, kl_ucb_lower_threshold, kl_ucb_n0, kl_ucb_n1
 
 from student import Student
+from log_writer import LogWriter
 
 # Create test logger.
 logger = logging.getLogger("zpd")
 logger.setLevel(logging.DEBUG)
 
-# Create file handler that logs to file tagged current date and time.
+# Create a background writer that logs to a rotated file, so that the
+# algorithms only put records on a queue.
 time_stamp = time.strftime("%Y%m%d_%H%M", datetime.now().timetuple())
-fh = logging.FileHandler(f"logs/log", mode='w+')
-fh.setLevel(logging.DEBUG)
+log_writer = LogWriter(log_file, logging.DEBUG)
+log_writer.start()
+atexit.register(log_writer.stop)
 
 # Create console handler that log warnings and above.
 ch = logging.StreamHandler()
@@ -36,11 +45,10 @@ ch.setLevel(logging.WARNING)
 
 # create formatter and add it to the handlers
 formatter = logging.Formatter('%(name)s - %(funcName)s - %(levelname)s - %(message)s')
-fh.setFormatter(formatter)
 ch.setFormatter(formatter)
 
 # add the handlers to the logger
-logger.addHandler(fh)
+logger.addHandler(log_writer.handler)
 logger.addHandler(ch)
 def get_kc(problem):
     trace = problem[3]
@@ -108,18 +116,50 @@ def main():
                            get_solution)
 
 
-    generate_2digitaddition_traces(ndigit_n_dict, trace_file)
-
-    generate_curriculum(trace_file,
-                        progression_graph_file,
-                        trace_problems_file,
-                        cmp_trace)
-
-    with open(progression_graph_file, "r") as f:
-        progression_graph = json.load(f)
-    
-    with open(trace_problems_file, "r") as f:
-        trace_problems_dict = json.load(f)
+    def build():
+        # Stream the generated rows straight into the curriculum, the trace
+        # file is only kept as a side output.
+        if trace_catalog_ndigits is None:
+            rows = iter_2digitaddition_traces(ndigit_n_dict,
+                                              trace_seed,
+                                              trace_workers,
+                                              trace_shard_size)
+        else:
+            rows = iter_2digitaddition_catalog(trace_catalog_ndigits,
+                                               problems_per_trace,
+                                               trace_seed)
+        return generate_curriculum_from_rows(
+                                    rows,
+                                    progression_graph_file,
+                                    trace_problems_file,
+                                    cmp_trace,
+                                    trace_file,
+                                    more_complex_classes=more_complex_classes,
+                                    n_workers=progression_workers)
+
+    def write_outputs(curriculum):
+        # Rewrite the side outputs of build from a cached curriculum, so that
+        # they match it.
+        write_curriculum_files(curriculum.progression_graph,
+                               curriculum.trace_problems_dict,
+                               progression_graph_file,
+                               trace_problems_file,
+                               trace_file)
+
+    # Reuse the curriculum of an earlier run with the same inputs, kept as a
+    # memory mapped artifact rather than in dictionaries.
+    curriculum = cached_curriculum(build, {"ndigit_n_dict": ndigit_n_dict,
+                                           "ngram_size": ngram_size,
+                                           "action_tag_dict": action_tag_dict,
+                                           "catalog_ndigits":
+                                               trace_catalog_ndigits,
+                                           "problems_per_trace":
+                                               problems_per_trace,
+                                           "seed": trace_seed,
+                                           "shard_size": trace_shard_size},
+                                   on_hit=write_outputs)
+    progression_graph = curriculum.progression_graph
+    trace_problems_dict = curriculum.trace_problems_dict
 
     zpd = kl_ucb_zpd(progression_graph,
                                trace_problems_dict,
@@ -128,7 +168,8 @@ def main():
                                kl_ucb_n1,
                                kl_ucb_timeout,
                                kl_ucb_p_threshold,
-                               kl_ucb_student)
+                               kl_ucb_student,
+                               curriculum.reachability_index())
     logger.info(f"Student status:{kl_ucb_student.status()}")
     log = f"Current ZPD:"
     for trace in zpd:
@@ -1,17 +1,23 @@
+import atexit
 import time
 import logging
 from datetime import datetime
-import json
 
 from copy import deepcopy
-from generate_trace import generate_2digitaddition_traces
-from generate_curriculum import generate_curriculum
-from compare_traces import cmp_trace
-from init_zpd import initial_zpd
+from generate_trace import iter_2digitaddition_traces, \
+    iter_2digitaddition_catalog
+from generate_curriculum import generate_curriculum_from_rows, \
+    write_curriculum_files
+from curriculum_cache import cached_curriculum
+from compare_traces import cmp_trace, more_complex_classes
+from placement_tree import cached_placement_tree, precompiled_initial_zpd
 from zpdes import zpdes
 from hyperparameters import ndigit_n_dict, trace_file, progression_graph_file, \
+    trace_catalog_ndigits, problems_per_trace, trace_seed, trace_workers, \
+    trace_shard_size, progression_workers, \
+    ngram_size, action_tag_dict, log_file, \
     trace_problems_file, init_zpd_entropy_threshold, \
-    init_zpd_regularisation_0, zpdes_beta, zpdes_eta, \
+    init_zpd_regularisation_0, placement_tree_depth, zpdes_beta, zpdes_eta, \
     zpdes_d, zpdes_h, zpdes_initial_weight, zpdes_gamma, \
     guess_probabilities, slip_probabilities, knowledge_components,\
     knowledge_component_prerequisites, student1_kc_states, student2_kc_states,\
@@ -19,15 +25,18 @@ from hyperparameters import ndigit_n_dict, trace_file, progression_graph_file, \
     transition_probabilities_zpdes, transition_probabilities_init_zpd
 
 from student import Student
+from log_writer import LogWriter
 
 # Create test logger.
 logger = logging.getLogger("zpd")
 logger.setLevel(logging.DEBUG)
 
-# Create file handler that logs to file tagged current date and time.
+# Create a background writer that logs to a rotated file, so that the
+# algorithms only put records on a queue.
 time_stamp = time.strftime("%Y%m%d_%H%M", datetime.now().timetuple())
-fh = logging.FileHandler(f"logs/log", mode='w+')
-fh.setLevel(logging.DEBUG)
+log_writer = LogWriter(log_file, logging.DEBUG)
+log_writer.start()
+atexit.register(log_writer.stop)
 
 # Create console handler that log warnings and above.
 ch = logging.StreamHandler()
@@ -35,11 +44,10 @@ ch.setLevel(logging.WARNING)
 
 # create formatter and add it to the handlers
 formatter = logging.Formatter('%(name)s - %(funcName)s - %(levelname)s - %(message)s')
-fh.setFormatter(formatter)
 ch.setFormatter(formatter)
 
 # add the handlers to the logger
-logger.addHandler(fh)
+logger.addHandler(log_writer.handler)
 logger.addHandler(ch)
 def get_kc(problem):
     trace = problem[3]
@@ -115,24 +123,61 @@ def main():
                             get_kc,
                             get_solution)
 
-    generate_2digitaddition_traces(ndigit_n_dict, trace_file)
-
-    generate_curriculum(trace_file,
-                        progression_graph_file,
-                        trace_problems_file,
-                        cmp_trace)
-
-    with open(progression_graph_file, "r") as f:
-        progression_graph = json.load(f)
-    
-    with open(trace_problems_file, "r") as f:
-        trace_problems_dict = json.load(f)
-
-    init_zpd = initial_zpd(progression_graph,
-                            trace_problems_dict,
-                            init_zpd_regularisation_0,
-                            init_zpd_entropy_threshold,
-                            init_zpd_student)
+    def build():
+        # Stream the generated rows straight into the curriculum, the trace
+        # file is only kept as a side output.
+        if trace_catalog_ndigits is None:
+            rows = iter_2digitaddition_traces(ndigit_n_dict,
+                                              trace_seed,
+                                              trace_workers,
+                                              trace_shard_size)
+        else:
+            rows = iter_2digitaddition_catalog(trace_catalog_ndigits,
+                                               problems_per_trace,
+                                               trace_seed)
+        return generate_curriculum_from_rows(
+                                    rows,
+                                    progression_graph_file,
+                                    trace_problems_file,
+                                    cmp_trace,
+                                    trace_file,
+                                    more_complex_classes=more_complex_classes,
+                                    n_workers=progression_workers)
+
+    def write_outputs(curriculum):
+        # Rewrite the side outputs of build from a cached curriculum, so that
+        # they match it.
+        write_curriculum_files(curriculum.progression_graph,
+                               curriculum.trace_problems_dict,
+                               progression_graph_file,
+                               trace_problems_file,
+                               trace_file)
+
+    # Reuse the curriculum of an earlier run with the same inputs, kept as a
+    # memory mapped artifact rather than in dictionaries.
+    curriculum = cached_curriculum(build, {"ndigit_n_dict": ndigit_n_dict,
+                                           "ngram_size": ngram_size,
+                                           "action_tag_dict": action_tag_dict,
+                                           "catalog_ndigits":
+                                               trace_catalog_ndigits,
+                                           "problems_per_trace":
+                                               problems_per_trace,
+                                           "seed": trace_seed,
+                                           "shard_size": trace_shard_size},
+                                   on_hit=write_outputs)
+    progression_graph = curriculum.progression_graph
+    trace_problems_dict = curriculum.trace_problems_dict
+
+    # Walk the placement policy compiled with the curriculum, falling back to
+    # live computation past its depth.
+    placement_tree = cached_placement_tree(curriculum,
+                                           init_zpd_regularisation_0,
+                                           init_zpd_entropy_threshold,
+                                           placement_tree_depth)
+    init_zpd = precompiled_initial_zpd(placement_tree,
+                                       curriculum.reachability_index(),
+                                       trace_problems_dict,
+                                       init_zpd_student)
 
     # logger.info(f"Before init_zpd {init_zpd_student.status()}")
     # logger.info(f"After init_zpd {init_zpd_student.status()}")
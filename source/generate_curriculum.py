@@ -3,20 +3,57 @@ from collections import defaultdict
 import logging
 import json
 
+import numpy as np
+
+from compare_traces import ngram_postings, ngram_signature, \
+    postings_intersection, signature_bits
+from hyperparameters import ngram_size
+from lazy_log import lazy_mapping
+from trace_encoding import encode_trace, decode_trace
+
 logger = logging.getLogger(f"zpd.{__name__}")
 logger.setLevel(logging.DEBUG)
 
-def form_progression(traces, cmp_trace):
+def form_progression(traces,
+                     cmp_trace,
+                     cmp_matrix=None,
+                     more_complex_classes=None,
+                     n_workers=1):
     """
     Function takes a set of traces and forms a progression of the traces
-    based on their complexity.
+    based on their complexity. When cmp_matrix, the batched counterpart of
+    cmp_trace (e.g. compare_traces.cmp_matrix), is given the whole relation is
+    computed at once instead of pair by pair. When more_complex_classes (e.g.
+    compare_traces.more_complex_classes) is given only the relation between
+    classes of equivalent traces is computed, from an inverted n-gram index,
+    split across n_workers processes when n_workers > 1.
 
     Parameter(s):
         traces: set(string)
+        cmp_trace: function(string, string -> int)
+        cmp_matrix: function(list(string) -> np.ndarray) or None
+        more_complex_classes: function(list(string)[, int] ->
+            (np.ndarray, list(set(int)))) or None, called with n_workers as
+            a second argument only when n_workers > 1.
+        n_workers: int
 
     Returns:
         trimmed_progression_graph: dict(string -> list(string))
     """
+    if more_complex_classes is not None:
+        traces = list(traces)
+        # n_workers is only passed on when asked for, so single argument
+        # callables keep working.
+        if n_workers > 1:
+            classes, class_more_complex = more_complex_classes(traces,
+                                                               n_workers)
+        else:
+            classes, class_more_complex = more_complex_classes(traces)
+        return reduce_progression(traces, classes, class_more_complex)
+
+    if cmp_matrix is not None:
+        traces = list(traces)
+        return form_progression_from_matrix(traces, cmp_matrix(traces))
     
     # Create a graph traces with directed edges from less complex trace
     # to a more complex trace according to their respective ngrams.
@@ -42,10 +79,297 @@ def form_progression(traces, cmp_trace):
     
     return trimmed_progression_graph
 
+def form_progression_from_matrix(traces, matrix):
+    """
+    Function takes a list of traces and their cmp_trace matrix and forms the
+    same progression as form_progression. The "more complex" relation is a
+    strict partial order, so the trimmed graph is its transitive reduction,
+    found with one pass over the more complex traces per trace in
+    topological order instead of a comparison per pair of edges.
+
+    Parameter(s):
+        traces: list(string)
+        matrix: np.ndarray(int, shape=(N, N)), matrix[i, j] being
+            cmp_trace(traces[i], traces[j]).
+
+    Returns:
+        trimmed_progression_graph: dict(string -> list(string))
+    """
+
+    # Traces with identical rows compare the same way with every trace (many
+    # traces share their n-grams), so the reduction runs on one representative
+    # per class of such traces and is expanded afterwards.
+    row_class_dict = {}
+    classes = np.empty(len(traces), dtype=np.int64)
+    for i, row in enumerate(matrix):
+        classes[i] = row_class_dict.setdefault(row.tobytes(),
+                                               len(row_class_dict))
+    representatives = np.unique(classes, return_index=True)[1]
+    more_complex = matrix[np.ix_(representatives, representatives)] > 0
+    class_more_complex = [set(np.flatnonzero(column).tolist())
+                          for column in more_complex.T]
+
+    return reduce_progression(traces, classes, class_more_complex)
+
+def reduce_progression(traces, classes, more_complex):
+    """
+    Function takes traces grouped into classes of traces comparing the same
+    way with every trace and the "more complex" relation between the classes
+    and returns the transitive reduction of the relation between the traces.
+    The relation stays in its sparse form, so the cost follows the number of
+    comparable pairs rather than the square of the number of classes.
+
+    Parameter(s):
+        traces: list(string)
+        classes: np.ndarray(int, shape=(N,)), the class of every trace.
+        more_complex: list(set(int)), for every class the classes strictly
+            more complex than it.
+
+    Returns:
+        trimmed_progression_graph: dict(string -> list(string))
+    """
+
+    # A class is more complex than every class less complex than the ones
+    # below it, so ordering by the number of less complex classes is a
+    # topological order.
+    less_complex_counts = np.zeros(len(more_complex), dtype=np.int64)
+    for more_complex_set in more_complex:
+        less_complex_counts[list(more_complex_set)] += 1
+    order = np.argsort(less_complex_counts, kind="stable")
+    position = np.empty(len(more_complex), dtype=np.int64)
+    position[order] = np.arange(len(more_complex))
+
+    class_traces = [[] for _ in more_complex]
+    for i, c in enumerate(classes.tolist()):
+        class_traces[c].append(traces[i])
+
+    revised_class_traces = []
+    for more_complex_set in more_complex:
+        # The first remaining class in topological order is not more complex
+        # than any other remaining one, so it is kept and everything more
+        # complex than it is dropped.
+        revised_traces = list()
+        dropped = set()
+        for d in sorted(more_complex_set, key=position.__getitem__):
+            if d not in dropped:
+                revised_traces.extend(class_traces[d])
+                dropped |= more_complex[d]
+        revised_class_traces.append(revised_traces)
+
+    trimmed_progression_graph = {}
+    for i, trace in enumerate(traces):
+        trimmed_progression_graph[trace] = list(
+                                        revised_class_traces[classes[i]])
+
+    return trimmed_progression_graph
+
+class ProgressionPostings():
+    """
+    Class for the inverted index from every n-gram of the traces of a
+    progression graph to the traces containing it, along with the traces no
+    trace is less complex than. It is built once per batch of insertions and
+    kept up to date by insert_trace.
+    """
+
+    def __init__(self, progression_graph):
+        self.traces = list(progression_graph)
+        self.bit_traces_dict = ngram_postings([ngram_signature(t)
+                                               for t in self.traces])
+        more_complex_traces = {t
+                               for more_complex in progression_graph.values()
+                               for t in more_complex}
+        self.sources = {t for t in self.traces
+                        if t not in more_complex_traces}
+
+    def add(self, trace):
+        """
+        Method that adds a trace to the index.
+        """
+        for bit in signature_bits(ngram_signature(trace)):
+            self.bit_traces_dict[bit].add(len(self.traces))
+        self.traces.append(trace)
+
+    def at_least_complex(self, trace):
+        """
+        Method that returns the traces at least as complex as trace, those
+        containing all its n-grams plus, for a trace shorter than ngram_size,
+        those containing it by the substring rule.
+
+        Parameter(s):
+            trace: string
+
+        Returns:
+            at_least_complex_traces: list(string)
+        """
+        indices = postings_intersection(ngram_signature(trace),
+                                        self.bit_traces_dict)
+        if len(trace) < ngram_size:
+            indices.update(i for i, t in enumerate(self.traces) if trace in t)
+
+        return [self.traces[i] for i in sorted(indices)]
+
+    def __repr__(self):
+        return (f"ProgressionPostings(n_traces={len(self.traces)}, "
+                f"n_sources={len(self.sources)})")
+
+
+def insert_trace(progression_graph, trace, cmp_trace, postings=None):
+    """
+    Function that inserts a new trace into a progression graph formed by
+    form_progression, fixing up only the edges around it. The result is the
+    progression form_progression would form with the trace included.
+
+    The traces more complex than the new one come from the n-gram postings
+    and the new trace gets edges to those no other one of them has an edge
+    to. The traces less complex than it are found by walking the graph from
+    its sources through less complex traces only, and those with no edge to
+    another less complex trace get an edge to it. Only the traces around the
+    new one are compared with it.
+
+    Parameter(s):
+        progression_graph: dict(string -> list(string)), updated in place.
+        trace: string
+        cmp_trace: function(string, string -> int)
+        postings: ProgressionPostings or None, built from progression_graph
+            when None and updated in place otherwise.
+
+    Returns:
+        None
+    """
+    if postings is None:
+        postings = ProgressionPostings(progression_graph)
+
+    more_complex_traces = [t for t in postings.at_least_complex(trace)
+                           if cmp_trace(t, trace) > 0]
+
+    # The traces more complex than the new one are closed upwards, so one is
+    # a minimal one unless another one has an edge to it.
+    covered_traces = {x for t in more_complex_traces
+                      for x in progression_graph[t]}
+
+    # The traces less complex than the new one are closed downwards, so they
+    # are all reached from the sources through less complex traces.
+    stack = [t for t in postings.sources if cmp_trace(trace, t) > 0]
+    reached = set(stack)
+    maximal_less_complex_traces = []
+    while stack:
+        t = stack.pop()
+        less_complex_successors = [x for x in progression_graph[t]
+                                   if cmp_trace(trace, x) > 0]
+        if not less_complex_successors:
+            maximal_less_complex_traces.append(t)
+        for x in less_complex_successors:
+            if x not in reached:
+                reached.add(x)
+                stack.append(x)
+
+    # Edges from the new trace, as in form_progression.
+    progression_graph[trace] = [t for t in more_complex_traces
+                                if t not in covered_traces]
+
+    # Edges from a maximal less complex trace to a trace more complex than
+    # the new one become excess and an edge to the new trace is added. A less
+    # complex trace that is not maximal had no edge to a more complex trace.
+    more_complex_set = set(more_complex_traces)
+    for t in maximal_less_complex_traces:
+        revised_traces = [x for x in progression_graph[t]
+                          if x not in more_complex_set]
+        revised_traces.append(trace)
+        progression_graph[t] = revised_traces
+
+    if not reached:
+        postings.sources.add(trace)
+    postings.sources.difference_update(progression_graph[trace])
+    postings.add(trace)
+
+    return None
+
+def update_curriculum(progression_graph,
+                      trace_problems_dict,
+                      rows,
+                      cmp_trace):
+    """
+    Function takes an existing progression graph and trace-problem map and a
+    batch of new (operand1, operand2, sum, trace) rows. The problems are
+    appended to their traces and only the traces not seen before are
+    inserted into the progression graph, instead of forming it again.
+
+    Parameter(s):
+        progression_graph: dict(string -> list(string)), updated in place.
+        trace_problems_dict: dict(string -> list(tuple(int, int, int,
+            string))), updated in place.
+        rows: iterable(tuple(int, int, int, string))
+        cmp_trace: function(string, string -> int)
+
+    Returns:
+        new_traces: list(string)
+    """
+    new_traces = []
+    for row in rows:
+        trace = row[3]
+        if trace not in trace_problems_dict:
+            trace_problems_dict[trace] = []
+            new_traces.append(trace)
+        trace_problems_dict[trace].append(tuple(row))
+
+    if new_traces:
+        postings = ProgressionPostings(progression_graph)
+        for trace in new_traces:
+            insert_trace(progression_graph, trace, cmp_trace, postings)
+
+    log = f"Inserted {len(new_traces)} new trace(s) into the progression."
+    logger.info(log)
+
+    return new_traces
+
+def read_trace_rows(trace_file):
+    """
+    Generator that parses the rows of an open trace file written by
+    generate_trace into (operand1, operand2, sum, trace) tuples.
+
+    Parameter(s):
+        trace_file: file
+
+    Yields:
+        row: tuple(int, int, int, string)
+    """
+    reader = csv.reader(trace_file)
+    # Skip header.
+    next(reader)
+    for row in reader:
+        yield (int(row[0]), int(row[1]), int(row[2]), row[3])
+
+
+def group_trace_problems(rows):
+    """
+    Function that incrementally groups (operand1, operand2, sum, trace) rows
+    by their trace as they arrive. The null/start trace is added with no
+    problems.
+
+    Parameter(s):
+        rows: iterable(tuple(int, int, int, string))
+
+    Returns:
+        trace_problems_dict: dict(string -> list(tuple(int, int, int, string)))
+    """
+    trace_problems_dict = defaultdict(list)
+    for row in rows:
+        trace_problems_dict[row[3]].append(tuple(row))
+
+    # Add the null/start trace to trace_problems_dict.
+    trace_problems_dict[""] = []
+
+    return dict(trace_problems_dict)
+
+
 def generate_curriculum(trace_file_path,
                         progression_graph_file_path,
                         trace_problems_file_path,
-                        cmp_trace):
+                        cmp_trace,
+                        packed=False,
+                        cmp_matrix=None,
+                        more_complex_classes=None,
+                        n_workers=1):
     """
     Function takes trace file and generates a progression graph from those
     traces. It then writes the progression graph and the trace-problem map as
@@ -53,51 +377,191 @@ def generate_curriculum(trace_file_path,
 
     Parameter(s):
         trace_file_path: string
+        progression_graph_file_path: string
+        trace_problems_file_path: string
+        cmp_trace: function(string, string -> int)
+        packed: bool, see build_curriculum.
+        cmp_matrix: function(list(string) -> np.ndarray) or None, see
+            form_progression.
+        more_complex_classes: function or None, see form_progression.
+        n_workers: int, see form_progression.
     
     Returns:
-        None
+        progression_graph: dict(string -> list(string))
+        trace_problems_dict: dict(string -> list(tuple(int, int, int, string)))
     """
     
-    # Create a map between trace and corresponding problems. Also create a
-    # traces set.
+    # Create a map between trace and corresponding problems.
     logger.info("Creating progression from trace file.")
     with open(trace_file_path, 'r') as trace_file:
-        reader = csv.reader(trace_file)
-        # Skip header.
-        next(reader)
-        traces = set()
-        trace_problems_dict = defaultdict(list)
-        for row in reader:
-            trace = row[-1]
-            traces.add(trace)
-            trace_problems_dict[trace].append((int(row[0]),
-                                               int(row[1]),
-                                               int(row[2]),
-                                               row[3]))
-
-    # Add the null/start trace to trace_problems_dict and traces set.
-    trace_problems_dict[""] = []
-    traces.add("")
+        trace_problems_dict = group_trace_problems(read_trace_rows(trace_file))
+
+    return build_curriculum(trace_problems_dict,
+                            progression_graph_file_path,
+                            trace_problems_file_path,
+                            cmp_trace,
+                            packed,
+                            cmp_matrix,
+                            more_complex_classes,
+                            n_workers)
+
+
+def generate_curriculum_from_rows(rows,
+                                  progression_graph_file_path,
+                                  trace_problems_file_path,
+                                  cmp_trace,
+                                  trace_file_path=None,
+                                  packed=False,
+                                  cmp_matrix=None,
+                                  more_complex_classes=None,
+                                  n_workers=1):
+    """
+    Function takes (operand1, operand2, sum, trace) rows, e.g. straight from
+    generate_trace.iter_2digitaddition_traces, and generates the curriculum
+    without the round trip through a trace file. The rows are still written to
+    trace_file_path as a side output when it is given.
+
+    Parameter(s):
+        rows: iterable(tuple(int, int, int, string))
+        progression_graph_file_path: string
+        trace_problems_file_path: string
+        cmp_trace: function(string, string -> int)
+        trace_file_path: string or None
+        packed: bool, see build_curriculum.
+        cmp_matrix: function(list(string) -> np.ndarray) or None, see
+            form_progression.
+        more_complex_classes: function or None, see form_progression.
+        n_workers: int, see form_progression.
+
+    Returns:
+        progression_graph: dict(string -> list(string))
+        trace_problems_dict: dict(string -> list(tuple(int, int, int, string)))
+    """
+
+    logger.info("Creating progression from trace rows.")
+    if trace_file_path is None:
+        trace_problems_dict = group_trace_problems(rows)
+    else:
+        with open(trace_file_path, 'w') as trace_file:
+            writer = csv.writer(trace_file)
+            writer.writerow(['operand1', 'operand2', 'sum', 'trace'])
+
+            def written(rows):
+                for row in rows:
+                    writer.writerow(row)
+                    yield row
+
+            trace_problems_dict = group_trace_problems(written(rows))
+
+    return build_curriculum(trace_problems_dict,
+                            progression_graph_file_path,
+                            trace_problems_file_path,
+                            cmp_trace,
+                            packed,
+                            cmp_matrix,
+                            more_complex_classes,
+                            n_workers)
+
+
+def build_curriculum(trace_problems_dict,
+                     progression_graph_file_path,
+                     trace_problems_file_path,
+                     cmp_trace,
+                     packed=False,
+                     cmp_matrix=None,
+                     more_complex_classes=None,
+                     n_workers=1):
+    """
+    Function takes the trace-problem map and generates a progression graph
+    from its traces. It then writes the progression graph and the
+    trace-problem map as json objects to text files.
+
+    With packed, the progression is formed on the traces packed with
+    trace_encoding.encode_trace, so cmp_trace must compare packed traces
+    (e.g. compare_traces.cmp_trace_packed), and decoded for output.
+
+    Parameter(s):
+        trace_problems_dict: dict(string -> list(tuple(int, int, int, string)))
+        progression_graph_file_path: string
+        trace_problems_file_path: string
+        cmp_trace: function(string, string -> int)
+        packed: bool
+        cmp_matrix: function(list(string) -> np.ndarray) or None, see
+            form_progression.
+        more_complex_classes: function or None, see form_progression.
+        n_workers: int, see form_progression.
+
+    Returns:
+        progression_graph: dict(string -> list(string))
+        trace_problems_dict: dict(string -> list(tuple(int, int, int, string)))
+    """
+    traces = set(trace_problems_dict)
 
     # Create the progression by ordering traces according to relative n_gram
     # complexity.
-    progression_graph = form_progression(traces,cmp_trace)
+    if packed:
+        packed_progression_graph = form_progression(
+                                        {encode_trace(t) for t in traces},
+                                        cmp_trace,
+                                        cmp_matrix,
+                                        more_complex_classes,
+                                        n_workers)
+        progression_graph = {decode_trace(code): [decode_trace(c) for c in cs]
+                             for code, cs in packed_progression_graph.items()}
+    else:
+        progression_graph = form_progression(traces,
+                                             cmp_trace,
+                                             cmp_matrix,
+                                             more_complex_classes,
+                                             n_workers)
     logger.info("Finished creating progression.")
 
-    log = f"Progression graph."
-    for trace, more_complex_traces in progression_graph.items():
-        log += f"\n{trace} -> {more_complex_traces}"
-    logger.info(log)
+    logger.info("%s", lazy_mapping("Progression graph.", progression_graph))
+    logger.info("%s", lazy_mapping("Trace-Problems dictionary.",
+                                   trace_problems_dict))
 
-    log = f"Trace-Problems dictionary."
-    for trace, problems in trace_problems_dict.items():
-        log += f"\n{trace} -> {problems}"
-    logger.info(log)
+    write_curriculum_files(progression_graph,
+                           trace_problems_dict,
+                           progression_graph_file_path,
+                           trace_problems_file_path)
+
+    return progression_graph, trace_problems_dict
 
+
+def write_curriculum_files(progression_graph,
+                           trace_problems_dict,
+                           progression_graph_file_path,
+                           trace_problems_file_path,
+                           trace_file_path=None):
+    """
+    Function that writes the progression graph and the trace-problem map as
+    json objects to text files, and the problems to trace_file_path in the
+    format of generate_trace when it is given. Used for the side outputs of
+    a curriculum loaded from the cache, whose problems are written grouped
+    by trace rather than in the order they were generated.
+
+    Parameter(s):
+        progression_graph: mapping(string -> list(string))
+        trace_problems_dict: mapping(string ->
+            list(tuple(int, int, int, string)))
+        progression_graph_file_path: string
+        trace_problems_file_path: string
+        trace_file_path: string or None
+
+    Returns:
+        None
+    """
     with open(progression_graph_file_path, "w") as f:
-        json.dump(progression_graph, f)
+        json.dump(dict(progression_graph), f)
     
     with open(trace_problems_file_path, "w") as f:
-        json.dump(trace_problems_dict, f)
+        json.dump(dict(trace_problems_dict), f)
+
+    if trace_file_path is not None:
+        with open(trace_file_path, "w") as trace_file:
+            writer = csv.writer(trace_file)
+            writer.writerow(['operand1', 'operand2', 'sum', 'trace'])
+            for problems in trace_problems_dict.values():
+                writer.writerows(problems)
 
     return None
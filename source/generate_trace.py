@@ -1,14 +1,18 @@
 import csv
-import math
 import logging
+from itertools import product
+from multiprocessing import Pool
 
 import numpy as np
 
-from hyperparameters import action_tag_dict
+from hyperparameters import action_tag_dict, trace_shard_size
 
 logger = logging.getLogger(f"zpd.{__name__}")
 logger.setLevel(logging.DEBUG)
 
+# Widest operands that can be drawn and added as int64.
+max_int64_digits = len(str(np.iinfo(np.int64).max)) - 1
+
 
 def length(n):
     """ 
@@ -21,10 +25,9 @@ def length(n):
         n_digits: int
     """
 
-    if n == 0:
-        n_digits = 1
-    else:
-        n_digits = int(math.log10(n))+1
+    # Count the decimal digits exactly, math.log10 loses precision for
+    # integers wider than a float mantissa.
+    n_digits = len(str(abs(int(n))))
 
     return n_digits
 
@@ -74,15 +77,247 @@ def generate_2digitaddition_trace(op1, op2):
     return (result,  trace)
 
 
-def generate_2digitaddition_traces(ndigit_n_dict, trace_file_path):
+def trace_from_carries(carries):
+    """
+    Function takes the carry out of every column of an addition, least
+    significant column first, and returns the trace of that addition.
+
+    Parameter(s):
+        carries: list(int)
+
+    Returns:
+        trace: string
+    """
+    trace = ""
+    carry = 0
+    for c in carries:
+        if carry == 0:
+            trace += action_tag_dict["One digit addition without carry."]
+        else:
+            trace += action_tag_dict["One digit addition with carry."]
+
+        carry = c
+        if carry > 0:
+            trace += action_tag_dict["Writing a carry."]
+
+    if carry > 0:
+        trace += action_tag_dict["Bringing down a carry."]
+
+    return trace
+
+
+def generate_2digitaddition_traces_batch(ops):
+    """
+    Vectorised counterpart of generate_2digitaddition_trace. Function takes an
+    (n, 2) array of non-negative operand pairs, splits it into a digit matrix,
+    propagates the carries column by column for all pairs at once and returns
+    the sums and traces of the additions.
+
+    Parameter(s):
+        ops: np.ndarray(int, shape=(n, 2))
+
+    Returns:
+        results: np.ndarray(int, shape=(n,))
+        traces: np.ndarray(string, shape=(n,))
+    """
+    ops = np.asarray(ops, dtype=np.int64)
+    results = ops[:, 0] + ops[:, 1]
+    if len(ops) == 0:
+        return results, np.array([], dtype=object)
+
+    # Number of digits of every pair, i.e. of the longer operand.
+    width = length(int(ops.max()))
+    powers = 10 ** np.arange(width, dtype=np.int64)
+    n_digits = np.maximum(np.searchsorted(powers, ops.max(axis=1),
+                                          side='right'), 1)
+
+    # Digit matrix with the least significant column first.
+    digits = ((ops[:, :, None] // powers) % 10).astype(np.int8)
+
+    return results, traces_from_digit_matrix(digits, n_digits)
+
+
+def traces_from_digit_matrix(digits, n_digits):
+    """
+    Function takes an (n, 2, width) digit matrix of operand pairs, least
+    significant column first, propagates the carries column by column for all
+    pairs at once and returns their traces.
+
+    Parameter(s):
+        digits: np.ndarray(int, shape=(n, 2, width))
+        n_digits: np.ndarray(int, shape=(n,)), number of columns of each
+            pair taking part in its trace.
+
+    Returns:
+        traces: np.ndarray(string, shape=(n,))
+    """
+    n, _, width = digits.shape
+    if n == 0:
+        return np.array([], dtype=object)
+
+    # Carry out of every column, only the first n_digits columns of a row
+    # take part in its trace.
+    carries = np.zeros((n, width), dtype=np.int8)
+    carry = np.zeros(n, dtype=np.int8)
+    for i in range(width):
+        carry = (digits[:, 0, i] + digits[:, 1, i] + carry) // 10
+        carries[:, i] = carry
+    carries[np.arange(width) >= np.asarray(n_digits)[:, None]] = 0
+
+    # A trace is fixed by the digit count and the carry pattern, so build one
+    # string per distinct pattern and broadcast it back to the rows.
+    patterns = np.column_stack([n_digits, carries])
+    unique_patterns, inverse = np.unique(patterns, axis=0, return_inverse=True)
+    unique_traces = np.empty(len(unique_patterns), dtype=object)
+    for i, pattern in enumerate(unique_patterns.tolist()):
+        unique_traces[i] = trace_from_carries(pattern[1:pattern[0] + 1])
+
+    return unique_traces[inverse.reshape(-1)]
+
+
+def digit_matrix_to_ints(digits):
+    """
+    Function takes an (n, width) matrix of decimal digits, least significant
+    column first, and returns the integers they spell.
+
+    Parameter(s):
+        digits: np.ndarray(int, shape=(n, width))
+
+    Returns:
+        ints: list(int)
+    """
+    n, width = digits.shape
+    chars = np.ascontiguousarray(digits[:, ::-1] + ord('0'), dtype=np.uint8)
+
+    return [int(x) for x in chars.view(f"S{width}").reshape(-1).tolist()]
+
+
+def generate_2digitaddition_shard(ndigit, n, seed=None, shard=0):
+    """
+    Function that generates n random additions of two ndigit integers and
+    their traces. With a seed, the shard draws from its own random stream
+    derived from (seed, ndigit, shard), otherwise from the global np.random
+    state.
+
+    Parameter(s):
+        ndigit: int
+        n: int
+        seed: int or None
+        shard: int
+
+    Returns:
+        rows: list((int, int, int, string))
+    """
+    if seed is None:
+        rng = np.random
+    else:
+        rng = np.random.RandomState([seed, ndigit, shard])
+
+    if ndigit > max_int64_digits:
+        # Operands too wide for int64 are drawn digit by digit, without a
+        # leading zero, and only turned into Python integers for output.
+        digits = rng.randint(0, 10, (n, 2, ndigit)).astype(np.int8)
+        digits[:, :, -1] = rng.randint(1, 10, (n, 2))
+        traces = traces_from_digit_matrix(digits, np.full(n, ndigit))
+        ops1 = digit_matrix_to_ints(digits[:, 0])
+        ops2 = digit_matrix_to_ints(digits[:, 1])
+
+        return [(op1, op2, op1 + op2, trace)
+                for op1, op2, trace in zip(ops1, ops2, traces.tolist())]
+
+    int_range = (pow(10, ndigit - 1), pow(10, ndigit))
+    if int_range[0] == 1:
+        int_range = (0, int_range[1])
+
+    ops = rng.randint(int_range[0], int_range[1], (n, 2))
+    results, traces = generate_2digitaddition_traces_batch(ops)
+
+    return list(zip(ops[:, 0].tolist(),
+                    ops[:, 1].tolist(),
+                    results.tolist(),
+                    traces.tolist()))
+
+
+def _generate_2digitaddition_shard(args):
+    # Pool.imap passes a single argument.
+    return generate_2digitaddition_shard(*args)
+
+
+def iter_2digitaddition_traces(ndigit_n_dict,
+                               seed=None,
+                               n_workers=1,
+                               shard_size=trace_shard_size):
+    """
+    Generator takes ndigit_n_dict, a map from the length of the integers
+    and the number of integers/additions, and yields a row (operand1,
+    operand2, sum, trace) for that many additions of two integers.
+
+    The additions of each length are generated in shards of at most
+    shard_size rows, so memory stays bounded whatever ndigit_n_dict asks for,
+    and lengths beyond int64 are supported. With a seed, each shard draws from
+    a random stream derived from the seed and the shards are generated across
+    n_workers processes. Without one, a seed is drawn from the global
+    np.random state, so np.random.seed still makes runs repeatable. The
+    shards are yielded in order, so the rows only depend on the seed and
+    shard_size, not on n_workers.
+
+    Parameter(s):
+        ndigit_n_dict: dict(int -> int)
+        seed: int or None
+        n_workers: int
+        shard_size: int
+
+    Yields:
+        row: tuple(int, int, int, string)
+    """
+
+    # The global random state can not be shared between processes, so the
+    # shards of an unseeded run draw from a seed taken from it instead.
+    if seed is None:
+        seed = int(np.random.randint(np.iinfo(np.int32).max))
+        logger.info(f"Drew trace seed {seed}.")
+
+    shards = [(ndigit, min(shard_size, n - start), seed, shard)
+              for ndigit, n in ndigit_n_dict.items()
+              for shard, start in enumerate(range(0, n, shard_size))]
+
+    if n_workers <= 1:
+        pool = None
+        shard_rows = map(_generate_2digitaddition_shard, shards)
+    else:
+        pool = Pool(n_workers)
+        shard_rows = pool.imap(_generate_2digitaddition_shard, shards)
+
+    try:
+        for (ndigit, n, _, shard), rows in zip(shards, shard_rows):
+            log = (f"{n} addition pairs of {ndigit} digit(s) generated "
+                   f"in shard {shard}.")
+            logger.info(log)
+
+            yield from rows
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def generate_2digitaddition_traces(ndigit_n_dict,
+                                   trace_file_path,
+                                   seed=None,
+                                   n_workers=1,
+                                   shard_size=trace_shard_size):
     """
     Function takes ndigit_n_dict, a map from the length of the integers
     and the number of integers/additions. It then computes traces for that many
-    additions of two integers and writes them trace_file_path.
+    additions of two integers and writes them trace_file_path. See
+    iter_2digitaddition_traces for the remaining parameters.
     
     Parameter(s):
         ndigit_n_dict: dict(int -> int)
         trace_file_path: string
+        seed: int or None
+        n_workers: int
+        shard_size: int
 
     Returns:
         None
@@ -90,28 +325,210 @@ def generate_2digitaddition_traces(ndigit_n_dict, trace_file_path):
 
     logger.info("Opening trace file for writing.")
     with open(trace_file_path, 'w') as trace_file:
-        writer = csv.writer(trace_file)
-        writer.writerow(['operand1', 'operand2', 'sum', 'trace'])
-        for ndigit, n in ndigit_n_dict.items():
-            int_range = (pow(10, ndigit - 1), pow(10, ndigit))
-            if int_range[0] == 1:
-                int_range = (0, int_range[1])
-            
-            # Generate ntraces random numbers for each length.
-            ops_ndigit = np.random.randint(int_range[0],
-                                           int_range[1],
-                                           (n, 2))
-
-            log = f"{n} addition pairs of {ndigit} digit(s) generated."
-            logger.info(log)
+        write_trace_rows(iter_2digitaddition_traces(ndigit_n_dict,
+                                                    seed,
+                                                    n_workers,
+                                                    shard_size),
+                         trace_file)
 
-            for op1, op2 in ops_ndigit:
-                result, trace = generate_2digitaddition_trace(op1, op2)
-                writer.writerow([op1, op2, result, trace])
+    logger.info("Finished writing to trace file.")
+    
+    return
 
-            log = f"Finished generating traces for {ndigit} digit additions."
-            logger.info(log)
+
+def write_trace_rows(rows, trace_file):
+    """
+    Function that writes the header and the given (operand1, operand2, sum,
+    trace) rows to an open trace file.
+
+    Parameter(s):
+        rows: iterable(tuple(int, int, int, string))
+        trace_file: file
+
+    Returns:
+        None
+    """
+    writer = csv.writer(trace_file)
+    writer.writerow(['operand1', 'operand2', 'sum', 'trace'])
+    writer.writerows(rows)
+
+    return
+
+
+def column_digit_pairs(leading):
+    """
+    Function that groups the digit pairs of one addition column by the carry
+    coming into the column and the carry going out of it.
+
+    Parameter(s):
+        leading: bool, whether the column is the most significant column of
+            an operand with more than one digit (no leading zeros).
+
+    Returns:
+        carry_pairs_dict: dict((int, int) -> list((int, int)))
+    """
+    digits = range(1, 10) if leading else range(10)
+    carry_pairs_dict = {(i, o): [] for i in (0, 1) for o in (0, 1)}
+    for carry_in in (0, 1):
+        for d1 in digits:
+            for d2 in digits:
+                carry_out = (d1 + d2 + carry_in) // 10
+                carry_pairs_dict[(carry_in, carry_out)].append((d1, d2))
+
+    return carry_pairs_dict
+
+
+def enumerate_2digitaddition_traces(ndigit):
+    """
+    Function that enumerates every distinct trace of the additions of two
+    ndigit integers along with the number of operand pairs producing it. A
+    trace depends only on the carry out of each column, so every carry
+    pattern is one trace.
+
+    Parameter(s):
+        ndigit: int
+
+    Returns:
+        trace_count_dict: dict(string -> int)
+    """
+    inner = column_digit_pairs(False)
+    leading = column_digit_pairs(ndigit > 1)
+
+    trace_count_dict = {}
+    for carries in product((0, 1), repeat=ndigit):
+        count = 1
+        carry_in = 0
+        for i, carry_out in enumerate(carries):
+            pairs = leading if i == ndigit - 1 else inner
+            count *= len(pairs[(carry_in, carry_out)])
+            carry_in = carry_out
+
+        if count > 0:
+            trace_count_dict[trace_from_carries(carries)] = count
+
+    return trace_count_dict
+
+
+def sample_2digitaddition_problems(carries, n, rng=np.random):
+    """
+    Function that samples n operand pairs uniformly among those whose columns
+    produce the given carry pattern (least significant column first).
+
+    Parameter(s):
+        carries: tuple(int)
+        n: int
+        rng: np.random.RandomState, the global random state by default.
+
+    Returns:
+        ops: list((int, int))
+    """
+    ndigit = len(carries)
+    inner = column_digit_pairs(False)
+    leading = column_digit_pairs(ndigit > 1)
+
+    ops = [(0, 0)] * n
+    carry_in = 0
+    for i, carry_out in enumerate(carries):
+        pairs = (leading if i == ndigit - 1 else inner)[(carry_in, carry_out)]
+        choices = rng.randint(0, len(pairs), n)
+        place = pow(10, i)
+        ops = [(op1 + pairs[c][0] * place, op2 + pairs[c][1] * place)
+               for (op1, op2), c in zip(ops, choices.tolist())]
+        carry_in = carry_out
+
+    return ops
+
+
+def iter_2digitaddition_catalog(ndigits, problems_per_trace, seed=None):
+    """
+    Generator takes the lengths of the integers to add and, for each length,
+    enumerates every distinct trace instead of sampling random additions. It
+    yields a row (operand1, operand2, sum, trace) for problems_per_trace
+    additions sampled for each trace. With a seed, each length draws from a
+    random stream derived from (seed, ndigit), otherwise from the global
+    np.random state.
+
+    Parameter(s):
+        ndigits: iterable(int)
+        problems_per_trace: int
+        seed: int or None
+
+    Yields:
+        row: tuple(int, int, int, string)
+    """
+    for ndigit in ndigits:
+        trace_count_dict = enumerate_2digitaddition_traces(ndigit)
+
+        log = (f"{len(trace_count_dict)} distinct traces of {ndigit} "
+               f"digit(s) enumerated.")
+        logger.info(log)
+
+        yield from catalog_rows(ndigit,
+                                trace_count_dict,
+                                problems_per_trace,
+                                catalog_random_state(seed, ndigit))
+
+        log = f"Finished generating traces for {ndigit} digit additions."
+        logger.info(log)
+
+
+def catalog_random_state(seed, ndigit):
+    """
+    Function that returns the random state the catalog of one length draws
+    its problems from.
+    """
+    if seed is None:
+        return np.random
+    return np.random.RandomState([seed, ndigit])
+
+
+def catalog_rows(ndigit, trace_count_dict, problems_per_trace, rng):
+    """
+    Generator that yields problems_per_trace rows for every trace of
+    trace_count_dict, the enumerated traces of ndigit digit additions.
+    """
+    for carries in product((0, 1), repeat=ndigit):
+        trace = trace_from_carries(carries)
+        if trace not in trace_count_dict:
+            continue
+
+        ops = sample_2digitaddition_problems(carries, problems_per_trace, rng)
+        yield from ((op1, op2, op1 + op2, trace) for op1, op2 in ops)
+
+
+def generate_2digitaddition_catalog(ndigits,
+                                    problems_per_trace,
+                                    trace_file_path,
+                                    seed=None):
+    """
+    Function that writes the rows of iter_2digitaddition_catalog to
+    trace_file_path in the same format as generate_2digitaddition_traces.
+
+    Parameter(s):
+        ndigits: iterable(int)
+        problems_per_trace: int
+        trace_file_path: string
+        seed: int or None
+
+    Returns:
+        catalog: dict(int -> dict(string -> int)), the number of operand pairs
+            producing each trace for every length.
+    """
+
+    catalog = {}
+    logger.info("Opening trace file for writing.")
+    with open(trace_file_path, 'w') as trace_file:
+        writer = csv.writer(trace_file)
+        writer.writerow(['operand1', 'operand2', 'sum', 'trace'])
+        for ndigit in ndigits:
+            trace_count_dict = enumerate_2digitaddition_traces(ndigit)
+            catalog[ndigit] = trace_count_dict
+            writer.writerows(catalog_rows(ndigit,
+                                          trace_count_dict,
+                                          problems_per_trace,
+                                          catalog_random_state(seed,
+                                                               ndigit)))
 
     logger.info("Finished writing to trace file.")
-    
-    return
\ No newline at end of file
+
+    return catalog
@@ -5,12 +5,33 @@ action_tag_dict = {"One digit addition without carry.": 'A',
 tag_action_dict = {tag: action for action, tag in action_tag_dict.items()}
 ngram_size = 3
 ndigit_n_dict = {1: 15, 2: 15, 3: 15, 4: 15}
+# Lengths whose trace catalog is enumerated, with problems_per_trace problems
+# per trace, instead of sampling ndigit_n_dict. None samples.
+trace_catalog_ndigits = None
+problems_per_trace = 4
+trace_seed = None
+trace_workers = 1
+trace_shard_size = 100000
+progression_workers = 1
 trace_file = "traces.csv"
 progression_graph_file = "progression_graph.txt"
 trace_problems_file = "trace_problems_dict.txt"
+curriculum_cache_dir = "curriculum_cache"
+curriculum_cache_max_bytes = 1 << 30
+curriculum_cache_max_age = 30 * 24 * 60 * 60
+# Iterations between the full node dumps of the algorithm loops, 1 dumping
+# on every iteration and 0 never.
+log_every_n = 10
+log_file = "logs/log"
+log_max_bytes = 64 << 20
+log_backup_count = 5
+log_queue_size = 100000
+log_queue_block = False
 
 init_zpd_regularisation_0 = 4
 init_zpd_entropy_threshold = 0.35
+# Answers covered by the precompiled placement tree, 2 ** depth leaves.
+placement_tree_depth = 8
 
 zpdes_beta = 0.9
 zpdes_eta = 0.4
@@ -118,4 +139,6 @@ kl_ucb_timeout = 1000
 kl_ucb_lower_threshold = 0.5
 kl_ucb_n0 = 1
 kl_ucb_n1 = 1
-kl_ucb_p_threshold = 0.7
\ No newline at end of file
+kl_ucb_p_threshold = 0.7
+# Width to which the KL lower confidence bounds are bisected.
+kl_ucb_tolerance = 1e-12
\ No newline at end of file
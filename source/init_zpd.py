@@ -1,13 +1,21 @@
 from collections import defaultdict
+from copy import copy
 from enum import Enum
-from math import log
 import logging
+import time
 
-from compare_traces import atleast_complex
+import numpy as np
+
+from lazy_log import LazyMessage, format_mapping, lazy_items, lazy_mapping, \
+    log_sampled
+from reachability import ReachabilityIndex
 
 logger = logging.getLogger(f"zpd.{__name__}")
 logger.setLevel(logging.DEBUG)
 
+# Split weights closer than this are taken as equal.
+split_tolerance = 1e-9
+
 class Colour(Enum):
     UNCOLOURED = 0
     SOLVABLE = 1
@@ -17,44 +25,152 @@ class Visit(Enum):
     VISITED = 0
     UNVISITED = 1
 
+# Entropy weights indexed by (c, ic), for every c0 used, see entropy_table.
+entropy_table_dict = {}
+
+def entropy_table(c0, c_size, ic_size):
+    """
+    Function that returns the table of node weights indexed by (c, ic) for a
+    given c0, covering at least c < c_size and ic < ic_size. Tables are kept
+    in entropy_table_dict and grown by doubling, the counts being small
+    integers that repeat constantly.
+
+    Parameter(s):
+        c0: float
+        c_size: int
+        ic_size: int
+
+    Returns:
+        table: np.ndarray(float, shape=(>= c_size, >= ic_size))
+    """
+    table = entropy_table_dict.get(c0)
+    if (table is not None and table.shape[0] >= c_size
+        and table.shape[1] >= ic_size):
+        return table
+
+    shape = (16, 16) if table is None else table.shape
+    c_size = max(shape[0], 1 << max(0, c_size - 1).bit_length())
+    ic_size = max(shape[1], 1 << max(0, ic_size - 1).bit_length())
+    c = np.arange(c_size)[:, None]
+    ic = np.arange(ic_size)[None, :]
+    arg = (c + c0) / (ic + 2 * c0)
+    inside = (arg > 0) & (arg < 1)
+    arg = np.where(inside, arg, 0.5)
+    table = np.where(inside,
+                     -(arg * np.log2(arg) + (1 - arg) * np.log2(1 - arg)),
+                     0)
+    entropy_table_dict[c0] = table
+
+    return table
+
+
+def entropy_weights(c, ic, c0):
+    """
+    Function that looks up the weights of nodes with the given correctness
+    counts, as Node_initZPD.update_weight computes for one node.
+
+    Parameter(s):
+        c: np.ndarray(int)
+        ic: np.ndarray(int)
+        c0: float
+
+    Returns:
+        weights: np.ndarray(float)
+    """
+    c = np.asarray(c)
+    ic = np.asarray(ic)
+    if c.size == 0:
+        return np.zeros(c.shape)
+
+    table = entropy_table_dict.get(c0)
+    c_size = int(c.max()) + 1
+    ic_size = int(ic.max()) + 1
+    if (table is None or table.shape[0] < c_size
+        or table.shape[1] < ic_size):
+        table = entropy_table(c0, c_size, ic_size)
+    return table[c, ic]
+
+
+class NodeStore():
+    """
+    Class for the state of many init_zpd nodes as arrays, one entry per node.
+    The arrays can have any shape, e.g. traces or (students x traces), and
+    the update methods take any numpy index selecting the nodes to update.
+    """
+
+    def __init__(self, shape, c0):
+        self.c0 = c0
+        self.c = np.zeros(shape, dtype=np.int32)
+        self.ic = np.zeros(shape, dtype=np.int32)
+        self.colour = np.full(shape, Colour.UNCOLOURED.value, dtype=np.int8)
+        self.weight = np.full(shape, entropy_table(c0, 1, 1)[0, 0])
+
+    def update_correctness(self, index, correct):
+        """
+        Method that records an answer for the nodes selected by index, as
+        Node_initZPD.update_correctness does. correct is a bool or an array
+        of bools for the selected nodes.
+        """
+        c = self.c[index]
+        ic = self.ic[index]
+        correct = np.asarray(correct, dtype=bool)
+        self.c[index] = c + (correct & (ic == 0)) - (~correct & (c > 0))
+        self.ic[index] = ic - (correct & (ic > 0)) + (~correct & (c == 0))
+
+    def update_weights(self, index):
+        """
+        Method that updates the weights of the nodes selected by index.
+        """
+        self.weight[index] = entropy_weights(self.c[index],
+                                             self.ic[index],
+                                             self.c0)
+
+
 class Node_initZPD():
     """
     Class for objects corresponding to the nodes in init_zpd algorithm
-    described in the paper.
+    described in the paper. The node state lives at index in a NodeStore, a
+    node created without one gets a store of its own.
     """
 
-    def __init__(self, c0):
-        self.c = 0
-        self.ic = 0
-        self.colour = Colour.UNCOLOURED
-        self.c0 = c0
-        self.update_weight()
-        # self.previous = 0
+    __slots__ = ("store", "index")
 
-    def update_weight(self):
-        arg = (self.c + self.c0) / (self.ic + 2 * self.c0)
+    def __init__(self, c0, store=None, index=0):
+        if store is None:
+            store = NodeStore(1, c0)
+        self.store = store
+        self.index = index
 
-        if arg <= 0 or arg >= 1:
-            self.weight = 0
-        else:
-            self.weight = self.entropy(arg)
+    @property
+    def c0(self):
+        return self.store.c0
 
-    def update_correctness(self, correct):
-        if correct:
-            if self.ic == 0:
-                self.c += 1
-            else:
-                self.ic -= 1
-        else:
-            if self.c == 0:
-                self.ic += 1
-            else:
-                self.c -= 1
+    @property
+    def c(self):
+        return int(self.store.c[self.index])
 
+    @property
+    def ic(self):
+        return int(self.store.ic[self.index])
+
+    @property
+    def weight(self):
+        return float(self.store.weight[self.index])
+
+    @property
+    def colour(self):
+        return Colour(self.store.colour[self.index])
+
+    @colour.setter
+    def colour(self, colour):
+        self.store.colour[self.index] = colour.value
+
+    def update_weight(self):
+        self.store.update_weights(self.index)
+
+    def update_correctness(self, correct):
+        self.store.update_correctness(self.index, correct)
 
-    def entropy(self, arg):
-        return -(arg * log(arg, 2) + (1 - arg) * log((1 - arg), 2))
-    
     def __repr__(self):
         return (f"Node_initZPD(c0={self.c0}")
     
@@ -151,52 +267,252 @@ def update_dependency_graph(dependency_graph, trace_node_dict):
     return updated_dependency_graph
 
 
-def get_initial_zpd(trace_to_node_dict, progression_graph):
+def is_correct(problem, answer):
+    return answer == problem[2]
+
+class Placement():
+    """
+    Class for the state of the initial zpd placement of one student, advanced
+    one answer at a time. select gives the trace to ask about next and record
+    updates the nodes with the answer, so the placement can be stopped, or
+    copied to explore other answers, at any point.
+
+    Node state is kept in a NodeStore indexed by the trace IDs of the
+    reachability index. The weights of the uncoloured nodes are also summed
+    over the traces at most (plus) and at least (minus) as complex as each
+    signature class; the sums are kept up to date from the weight changes of
+    each answer instead of being recomputed.
     """
-    Function that takes a trace node dictionary and makes a zpd set containing
-    traces that lie in the zpd according to the colour of the corresponding
-    nodes.
+
+    def __init__(self,
+                 reachability,
+                 trace_problems_dict,
+                 regularisation_0,
+                 entropy_threshold):
+        self.reachability = reachability
+        self.trace_problems_dict = trace_problems_dict
+        self.entropy_threshold = entropy_threshold
+        n_traces = len(reachability.traces)
+
+        self.store = NodeStore(n_traces, regularisation_0)
+        self.uncoloured = np.unpackbits(
+                                reachability.mask)[:n_traces].astype(bool)
+        self.initial_weight = entropy_weights(0, 0, regularisation_0)
+        self.weights = self.store.weight * self.uncoloured
+        self.class_plus_weights = (self.initial_weight
+                                   * reachability.at_most_sizes)
+        self.class_minus_weights = (self.initial_weight
+                                    * reachability.at_least_sizes)
+
+        # Number of problems of each trace asked, problems being asked in
+        # turn to avoid repetition.
+        self.asked = np.zeros(n_traces, dtype=np.int64)
+        self.problem_count = 0
+
+    def copy(self):
+        """
+        Method that returns an independent copy of the placement.
+        """
+        placement = copy(self)
+        placement.store = copy(self.store)
+        for name in ("c", "ic", "colour", "weight"):
+            setattr(placement.store, name,
+                    getattr(self.store, name).copy())
+        for name in ("uncoloured", "weights", "class_plus_weights",
+                     "class_minus_weights", "asked"):
+            setattr(placement, name, getattr(self, name).copy())
+        return placement
+
+    def nodes(self):
+        """
+        Method that returns a map from every trace to a node backed by the
+        store of the placement.
+        """
+        trace_id_dict = self.reachability.trace_id_dict
+        return {trace: Node_initZPD(self.store.c0, self.store, i)
+                for trace, i in trace_id_dict.items() if trace != ""}
+
+    def finished(self):
+        return not self.uncoloured.any()
+
+    def select(self):
+        """
+        Method that returns the ID of the trace with max min of total plus
+        weights and total minus weights, excluding the weight of the trace
+        itself. Ties, up to the rounding of the running sums, and the case of
+        no positive split go to the first trace in topological order.
+        """
+        classes = self.reachability.classes
+        split_weights = (np.minimum(self.class_plus_weights[classes],
+                                    self.class_minus_weights[classes])
+                         - self.weights)
+        split_weights[~self.uncoloured] = -1
+        max_min_weight = split_weights.max()
+        if max_min_weight > split_tolerance:
+            candidates = np.flatnonzero(split_weights >=
+                                        max_min_weight - split_tolerance)
+        else:
+            candidates = np.flatnonzero(self.uncoloured)
+        return candidates[np.argmin(self.reachability.rank[candidates])]
+
+    def next_problem(self, trace_id):
+        """
+        Method that returns the next problem of a trace, looping around its
+        problem list.
+        """
+        problems = self.trace_problems_dict[self.reachability.traces[trace_id]]
+        problem = problems[self.asked[trace_id] % len(problems)]
+        self.asked[trace_id] += 1
+        return problem
+
+    def record(self, trace_id, correctness):
+        """
+        Method that updates the correctness for the node of a trace and all
+        uncoloured node dependencies, the less complex traces if correct and
+        the more complex ones if not, and colours the nodes that went below
+        the entropy threshold.
+        """
+        reachability = self.reachability
+        store = self.store
+        self.problem_count += 1
+
+        if correctness:
+            dependencies = reachability.ancestors[
+                                    reachability.ancestor_rows[trace_id]]
+        else:
+            dependencies = reachability.descendants[
+                                    reachability.descendant_rows[trace_id]]
+        touched = (np.unpackbits(
+                        dependencies)[:len(reachability.traces)].astype(bool)
+                   & self.uncoloured)
+        touched[trace_id] = True
+        touched_ids = touched.nonzero()[0]
+        store.update_correctness(touched_ids, correctness)
+        store.update_weights(touched_ids)
+
+        # Remove traces that have gone below the entropy threshold. Only the
+        # touched nodes changed weight, the others were checked before.
+        new_weights = store.weight[touched_ids]
+        coloured_ids = touched_ids[new_weights < self.entropy_threshold]
+        store.colour[coloured_ids] = np.where(store.c[coloured_ids] > 0,
+                                              Colour.SOLVABLE.value,
+                                              Colour.UNSOLVABLE.value)
+        self.uncoloured[coloured_ids] = False
+        still_uncoloured = self.uncoloured[touched_ids]
+        new_weights = new_weights * still_uncoloured
+
+        # Update the plus and minus sums by the weight changes.
+        relation = reachability.class_relation
+        class_changes = np.bincount(reachability.classes[touched_ids],
+                                    weights=(new_weights
+                                             - self.weights[touched_ids]),
+                                    minlength=len(relation))
+        changed = np.flatnonzero(class_changes)
+        self.class_plus_weights += (relation[:, changed]
+                                    @ class_changes[changed])
+        self.class_minus_weights += (class_changes[changed]
+                                     @ relation[changed])
+        self.weights[touched_ids] = new_weights
+
+    def zpd(self):
+        """
+        Method that returns the zpd of the placement. Until every node is
+        coloured, this is the best current estimate: uncoloured nodes with
+        more correct than incorrect answers count as solvable.
+        """
+        solvable = ((self.store.colour == Colour.SOLVABLE.value)
+                    | (self.uncoloured & (self.store.c > 0)))
+        [zpd] = cohort_initial_zpds(self.reachability, solvable[None])
+        return zpd
+
+    def confidence(self):
+        """
+        Method that returns the share of the initial entropy of the nodes
+        that has been resolved, 1 once every node is coloured.
+        """
+        initial_entropy = (self.initial_weight
+                           * self.reachability.class_sizes.sum())
+        if initial_entropy <= 0:
+            return 1.0
+        return float(1 - self.weights.sum() / initial_entropy)
+
+
+def format_nodes(header, placement, line="\n{} -> {}"):
+    """
+    Function that formats a dump of the nodes of a placement, as
+    lazy_log.format_mapping. Passed to a LazyMessage, the nodes are only
+    built when the record is emitted.
 
     Parameter(s):
-        trace_node_dict: dict(string -> Node_initZPD)
-        progression_graph: dict(string -> list(string))
-    
+        header: string
+        placement: Placement
+        line: string
+
     Returns:
-        zpd: set(string)
+        message: string
     """
+    return format_mapping(header, placement.nodes(), line)
 
-    zpd = set()
-    solvable_traces = set()
-    for trace, node in trace_to_node_dict.items():
-        if node.colour == Colour.SOLVABLE:
-            solvable_traces.add(trace)
-    
-    if not solvable_traces:
-        zpd |= set(progression_graph[""])
-    else:
-        # Collect the traces corresponding to the ZPD region.
-        for trace in solvable_traces:
-            unsolved_set = set()
-            for t in progression_graph[trace]:
-                if t not in solvable_traces:
-                    unsolved_set.add(t)
-
-            if unsolved_set:
-                zpd |= unsolved_set
-                zpd.add(trace)
 
-    return zpd
+def place_student(placement, student, max_questions=None, deadline=None):
+    """
+    Function that asks a student questions chosen by a placement until every
+    node is coloured, max_questions have been asked or the deadline, a
+    time.monotonic() value, has passed.
+
+    Parameter(s):
+        placement: Placement
+        student: Student
+        max_questions: int
+        deadline: float
+
+    Returns:
+        None
+    """
+    traces = placement.reachability.traces
+    logger.info("%s", LazyMessage(format_nodes, "Generated dictionary: ",
+                                  placement, "\n{} -> NODE: {}"))
+
+    logger.info("Starting loop.")
+    while not placement.finished():
+        if (max_questions is not None
+            and placement.problem_count >= max_questions):
+            logger.info("Question budget of %s reached.", max_questions)
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            logger.info("Placement deadline reached.")
+            break
+
+        # Suggest a problem of chosen trace type to the student and record the 
+        # result.
+        chosen_id = placement.select()
+        problem = placement.next_problem(chosen_id)
+        answer = student.solve(problem)
+        correctness = is_correct(problem, answer)
+
+        logger.info("Chosen trace: %s, chosen problem: %s,answer: %s, "
+                    "Is correct: %s", traces[chosen_id], problem, answer,
+                    correctness)
+
+        placement.record(chosen_id, correctness)
+
+        log_sampled(logger, placement.problem_count, "%s",
+                    LazyMessage(format_nodes, "Updated nodes: ", placement))
+
+    logger.info("Finished loop.")
 
-def is_correct(problem, answer):
-    return answer == problem[2]
 
 def initial_zpd(progression_graph,
                 trace_problems_dict,
                 regularisation_0,
                 entropy_threshold,
-                student):
+                student,
+                reachability=None):
     """
-    Function that computes the initial zpd for a student object.
+    Function that computes the initial zpd for a student object. The
+    complexity relations between traces are looked up in reachability, which
+    is built from progression_graph when not given; pass the index of the
+    curriculum to share it between students.
 
     Parameter(s):
         progression_graph: dict(string -> list(string))
@@ -204,191 +520,238 @@ def initial_zpd(progression_graph,
         regularisation_0: float
         entropy_threshold: float
         student: Student
+        reachability: ReachabilityIndex
     
     Returns:
         zpd: set(string)
     """
-    problem_count = 0
-
-    # Traces set without the start trace.
-    traces = set(progression_graph.keys())
-    traces.remove("")
-    
-    # Create a map from trace to corresponding problem list iters. (To ask 
-    # all questions of a particular type, to prevent repitition)
-    trace_to_problem_iters_dict = {}
-    for t, probs in trace_problems_dict.items():
-        trace_to_problem_iters_dict[t] = iter(probs)
-
-    # Create a map from every trace to a corresponding initZPD node.
-    trace_to_node_dict = {}
-    for trace in traces:
-        # Problem: list or single instance?
-        trace_to_node_dict[trace] = Node_initZPD(regularisation_0)
+    if reachability is None:
+        reachability = ReachabilityIndex.from_progression_graph(
+                                                        progression_graph)
+
+    placement = Placement(reachability,
+                          trace_problems_dict,
+                          regularisation_0,
+                          entropy_threshold)
+    place_student(placement, student)
+    zpd = placement.zpd()
     
-    log = f"Generated dictionary: "
-    for t, n in trace_to_node_dict.items():
-        log += f"\n{t} -> NODE: {n}"
-    logger.info(log)
-
-    # Create a map from trace to traces at least as complex as it.
-    trace_to_at_least_complex_traces_dict = {}
-    for t1 in traces:
-        at_least_complex_traces_set = set()
-        for t2 in traces:
-            if atleast_complex(t2, t1):
-                at_least_complex_traces_set.add(t2)
-            
-        at_least_complex_traces_set.remove(t1)
-        trace_to_at_least_complex_traces_dict[t1] = at_least_complex_traces_set
- 
-    # Create a map from trace to traces at most as complex as it.
-    trace_to_at_most_complex_traces_dict = {}
-    for t1 in traces:
-        at_most_complex_traces_set = set()
-        for t2 in traces:
-            if atleast_complex(t1, t2):
-                at_most_complex_traces_set.add(t2)
-            
-        at_most_complex_traces_set.remove(t1)
-        trace_to_at_most_complex_traces_dict[t1] = at_most_complex_traces_set
- 
-    log = f"Generated map from trace to traces at least as complex: "
-    for t, alct in trace_to_at_least_complex_traces_dict.items():
-        log += f"\n{t} -> {alct}"
-    logger.info(log)
-
-    log = f"Generated map from trace to traces at most as complex: "
-    for t, amct in trace_to_at_most_complex_traces_dict.items():
-        log += f"\n{t} -> {amct}"
-    logger.info(log)
-
-    # Create two maps One from trace to traces less-complex than it. Another 
-    # from trace to traces more-complex than it.
-    trace_to_less_complex_traces_dict = {}
-    trace_to_more_complex_traces_dict = {}
-    for trace in traces:
-        trace_to_less_complex_traces_dict[trace] = set()
-        trace_to_more_complex_traces_dict[trace] = set()
-
-    for trace in traces:
-        unadded_set = set(progression_graph[trace])
-        more_complex_traces_set = set()
-        while len(unadded_set) > 0:
-            elem = unadded_set.pop()
-            unadded_set |= set(progression_graph[elem])
-            more_complex_traces_set.add(elem)
-            trace_to_less_complex_traces_dict[elem].add(trace)
-        
-        trace_to_more_complex_traces_dict[trace] = more_complex_traces_set
-
-    log = f"Generated map from trace to less complex traces: "
-    for t, lct in trace_to_less_complex_traces_dict.items():
-        log += f"\n{t} -> {lct}"
-    logger.info(log)
-
-    log = f"Generated map from trace to more complex traces: "
-    for t, mct in trace_to_more_complex_traces_dict.items():
-        log += f"\n{t} -> {mct}"
-    logger.info(log)
-
-    # Uncoloured set of nodes.
-    uncoloured_traces = set(traces)
-
-    # Loop.
-    logger.info("Starting loop.")
-    while len(uncoloured_traces) > 0:
-
-        # Find trace with max min of total plus weights and total minus weights.
-        max_min_weight = 0
-        # Pick an arbitrary trace.
-        chosen_trace = next(iter(uncoloured_traces))
-        for t1 in uncoloured_traces:
-            # Calculate total plus weight for t1.
-            amct_set = trace_to_at_most_complex_traces_dict[t]
-            tw_plus = 0
-            for t2 in amct_set:
-                if t2 in uncoloured_traces:
-                    tw_plus += trace_to_node_dict[t2].weight
-            
-            # Calculate total minus weight for t1.
-            alct_set = trace_to_at_least_complex_traces_dict[t]
-            tw_minus = 0
-            for t2 in alct_set:
-                if t2 in uncoloured_traces:
-                    tw_minus += trace_to_node_dict[t2].weight
-
-            min_weight = min(tw_plus, tw_minus)
-            if min_weight > max_min_weight:
-                chosen_trace = t1
-                max_min_weight = min_weight
+    logger.info("%s", lazy_items("Generated initial ZPD: ", zpd,
+                                 "\nTrace: {}"))
 
-        # Suggest a problem of chosen trace type to the student and record the 
-        # result.
-        try:
-            problem = next(trace_to_problem_iters_dict[chosen_trace])
-        except StopIteration:
-            trace_to_problem_iters_dict[chosen_trace] = iter(
-                                    trace_problems_dict[chosen_trace])
-            problem = next(trace_to_problem_iters_dict[chosen_trace])
+    logger.info("Number of problems asked: %s", placement.problem_count)
+    print(f"Init ZPD: {placement.problem_count}")
 
-        answer = student.solve(problem)
-        problem_count += 1
-        correctness = is_correct(problem, answer)
+    return zpd
 
-        log = (f"Chosen trace: {chosen_trace}, chosen problem: {problem},"
-               f"answer: {answer}, Is correct: {correctness}")
-        logger.info(log)
 
-        # Update the correctness for node and all node dependencies.
-        node = trace_to_node_dict[chosen_trace]
-        node.update_correctness(correctness)
-        node.update_weight()
+def budgeted_initial_zpd(progression_graph,
+                         trace_problems_dict,
+                         regularisation_0,
+                         entropy_threshold,
+                         student,
+                         max_questions=None,
+                         time_budget=None,
+                         reachability=None):
+    """
+    Function that computes the initial zpd for a student object within a
+    session budget. Placement stops after max_questions questions or
+    time_budget seconds, whichever comes first, and the best current
+    estimate of the zpd is returned with the share of the node entropy
+    resolved so far as its confidence. Without a budget it is initial_zpd
+    with a confidence of 1.
 
-        if correctness:
-            for t in trace_to_less_complex_traces_dict[chosen_trace]:
-                if t in uncoloured_traces:
-                    node  = trace_to_node_dict[t]
-                    node.update_correctness(correctness)
-                    node.update_weight()
-        
-        else:
-            for t in trace_to_more_complex_traces_dict[chosen_trace]:
-                if t in uncoloured_traces:
-                    node  = trace_to_node_dict[t]
-                    node.update_correctness(correctness)
-                    node.update_weight()
-        
-        # Remove traces that have gone below the entropy threshold.
-        coloured_traces_set = set()
-        for t in uncoloured_traces:
-            n = trace_to_node_dict[t]
-            if n.weight < entropy_threshold:
-                if n.c > 0:
-                    n.colour = Colour.SOLVABLE
-                else:
-                    n.colour = Colour.UNSOLVABLE
-                
-                coloured_traces_set.add(t)
-        
-        uncoloured_traces.difference_update(coloured_traces_set)
-
-        log = f"Updated nodes: "
-        for trace, node in trace_to_node_dict.items():
-            log += f"\n{trace} -> {node}"
-        logger.info(log)
+    Parameter(s):
+        progression_graph: dict(string -> list(string))
+        trace_problems_dict: dict(string -> list(int, int, int, string))
+        regularisation_0: float
+        entropy_threshold: float
+        student: Student
+        max_questions: int
+        time_budget: float
+        reachability: ReachabilityIndex
 
-    logger.info("Finished loop.")
+    Returns:
+        zpd: set(string)
+        confidence: float
+    """
+    deadline = None
+    if time_budget is not None:
+        deadline = time.monotonic() + time_budget
 
-    zpd = get_initial_zpd(trace_to_node_dict, progression_graph)
-    
-    log = f"Generated initial ZPD: "
-    for trace in zpd:
-        log += f"\nTrace: {trace}"
-    logger.info(log)
+    if reachability is None:
+        reachability = ReachabilityIndex.from_progression_graph(
+                                                        progression_graph)
 
-    logger.info(f"Number of problems asked: {problem_count}")
-    print(f"Init ZPD: {problem_count}")
+    placement = Placement(reachability,
+                          trace_problems_dict,
+                          regularisation_0,
+                          entropy_threshold)
+    place_student(placement, student, max_questions, deadline)
+    zpd = placement.zpd()
+    confidence = placement.confidence()
 
-    return zpd
+    logger.info("%s", lazy_items("Generated initial ZPD: ", zpd,
+                                 "\nTrace: {}"))
+    logger.info("Number of problems asked: %s, confidence: %s",
+                placement.problem_count, confidence)
+
+    return zpd, confidence
+
+
+def cohort_initial_zpds(reachability, solvable):
+    """
+    Function that returns the initial zpd of every student of a cohort from
+    the traces found solvable: the solvable traces followed by unsolved ones
+    in the progression graph along with those unsolved traces, or the traces
+    following the start trace when none is solvable.
 
+    Parameter(s):
+        reachability: ReachabilityIndex
+        solvable: np.ndarray(bool, shape=(S, N))
+
+    Returns:
+        zpds: list(set(string))
+    """
+    traces = reachability.traces
+    indptr = reachability.indptr
+    sources = np.repeat(np.arange(len(traces)), np.diff(indptr))
+    targets = reachability.indices
+
+    start = reachability.trace_id_dict[""]
+    start_zpd = {traces[j]
+                 for j in targets[indptr[start]:indptr[start + 1]].tolist()}
+
+    zpds = []
+    for row in solvable:
+        if not row.any():
+            zpds.append(set(start_zpd))
+            continue
+        # Solvable traces followed by an unsolved trace, and those traces.
+        frontier = row[sources] & ~row[targets]
+        zpds.append({traces[i] for i in np.concatenate(
+                        (sources[frontier], targets[frontier])).tolist()})
+
+    return zpds
+
+
+def initial_zpd_cohort(progression_graph,
+                       trace_problems_dict,
+                       regularisation_0,
+                       entropy_threshold,
+                       students,
+                       reachability=None):
+    """
+    Function that computes the initial zpds of a cohort of students in
+    lockstep. It follows initial_zpd for every student, but the correctness
+    counts, weights and colours are (students x traces) arrays, and each
+    question round selects, propagates and colours for all the students
+    still placing at once. A student drops out of the rounds when all of its
+    traces are coloured.
+
+    Parameter(s):
+        progression_graph: dict(string -> list(string))
+        trace_problems_dict: dict(string -> list(int, int, int, string))
+        regularisation_0: float
+        entropy_threshold: float
+        students: list(Student)
+        reachability: ReachabilityIndex
+
+    Returns:
+        zpds: list(set(string)), the zpd of every student.
+    """
+    if reachability is None:
+        reachability = ReachabilityIndex.from_progression_graph(
+                                                        progression_graph)
+
+    n_students = len(students)
+    traces = reachability.traces
+    classes = reachability.classes
+    relation = reachability.class_relation.astype(np.float64)
+    rank = reachability.rank
+    mask = np.unpackbits(reachability.mask)[:len(traces)].astype(bool)
+
+    store = NodeStore((n_students, len(traces)), regularisation_0)
+    uncoloured = np.tile(mask, (n_students, 1))
+    initial_weight = entropy_weights(0, 0, regularisation_0)
+    weights = initial_weight * uncoloured
+    class_plus_weights = np.tile(initial_weight * reachability.at_most_sizes,
+                                 (n_students, 1))
+    class_minus_weights = np.tile(initial_weight * reachability.at_least_sizes,
+                                  (n_students, 1))
+
+    # Number of problems of each trace asked to each student, problems being
+    # asked in turn as initial_zpd does.
+    asked = np.zeros((n_students, len(traces)), dtype=np.int64)
+    problem_counts = np.zeros(n_students, dtype=np.int64)
+
+    logger.info("Starting cohort loop for %s students.", n_students)
+    active = np.flatnonzero(uncoloured.any(axis=1))
+    while len(active) > 0:
+        # Select a trace for every active student, as in initial_zpd.
+        split_weights = (np.minimum(class_plus_weights[active][:, classes],
+                                    class_minus_weights[active][:, classes])
+                         - weights[active])
+        split_weights[~uncoloured[active]] = -1
+        max_min_weights = split_weights.max(axis=1, keepdims=True)
+        candidates = np.where(max_min_weights > split_tolerance,
+                              split_weights >= max_min_weights
+                                               - split_tolerance,
+                              uncoloured[active])
+        chosen = np.where(candidates, rank, len(traces)).argmin(axis=1)
+
+        correct = np.empty(len(active), dtype=bool)
+        for k, (s, i) in enumerate(zip(active.tolist(), chosen.tolist())):
+            problems = trace_problems_dict[traces[i]]
+            problem = problems[asked[s, i] % len(problems)]
+            asked[s, i] += 1
+            correct[k] = is_correct(problem, students[s].solve(problem))
+        problem_counts[active] += 1
+
+        # Nodes touched by the answers: the chosen trace and the uncoloured
+        # traces less complex than it if correct, more complex if not.
+        less = np.unpackbits(
+            reachability.ancestors[reachability.ancestor_rows[chosen]],
+            axis=1)[:, :len(traces)].astype(bool)
+        more = np.unpackbits(
+            reachability.descendants[reachability.descendant_rows[chosen]],
+            axis=1)[:, :len(traces)].astype(bool)
+        touched = np.where(correct[:, None], less, more) & uncoloured[active]
+        touched[np.arange(len(active)), chosen] = True
+
+        # Update the correctness and weights of the touched nodes, and colour
+        # those below the entropy threshold.
+        rows, columns = np.nonzero(touched)
+        students_touched = active[rows]
+        store.update_correctness((students_touched, columns), correct[rows])
+        store.update_weights((students_touched, columns))
+        new_weights = store.weight[students_touched, columns]
+        coloured = new_weights < entropy_threshold
+        coloured_nodes = (students_touched[coloured], columns[coloured])
+        store.colour[coloured_nodes] = np.where(store.c[coloured_nodes] > 0,
+                                                Colour.SOLVABLE.value,
+                                                Colour.UNSOLVABLE.value)
+        uncoloured[coloured_nodes] = False
+        new_weights[coloured] = 0
+
+        # Update the plus and minus sums by the weight changes.
+        class_changes = np.zeros((len(active), len(relation)))
+        np.add.at(class_changes, (rows, classes[columns]),
+                  new_weights - weights[students_touched, columns])
+        weights[students_touched, columns] = new_weights
+        class_plus_weights[active] += class_changes @ relation.T
+        class_minus_weights[active] += class_changes @ relation
+
+        log_sampled(logger, int(problem_counts.max()),
+                    "Cohort round: %s students placing.", len(active))
+        active = active[uncoloured[active].any(axis=1)]
+
+    logger.info("Finished cohort loop.")
+
+    zpds = cohort_initial_zpds(reachability,
+                               store.colour == Colour.SOLVABLE.value)
+
+    logger.info("%s", lazy_mapping("Number of problems asked per student: ",
+                                   dict(enumerate(problem_counts.tolist()))))
+
+    return zpds
@@ -1,13 +1,14 @@
 from collections import defaultdict
-from functools import cmp_to_key
 from operator import itemgetter
 import math
-import cvxpy as cp
 
 import logging
 
-from hyperparameters import ngram_size
-from compare_traces import cmp_trace
+import numpy as np
+
+from hyperparameters import ngram_size, kl_ucb_tolerance
+from lazy_log import lazy_items, lazy_mapping, log_sampled
+from reachability import ReachabilityIndex
 
 from student import KC_STATE
 logger = logging.getLogger(f"zpd.{__name__}")
@@ -40,6 +41,64 @@ class KL_UCB_node():
         return s
 
 
+def bernoulli_kl(p, u):
+    """
+    Function that returns the KL divergence in bits of Bernoulli(u) from
+    Bernoulli(p), elementwise, with 0 log 0 taken as 0.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kl = (np.where(p > 0, p * np.log(p / u), 0.)
+              + np.where(p < 1, (1 - p) * np.log((1 - p) / (1 - u)), 0.))
+    return kl / math.log(2)
+
+
+def kl_lower_bounds(p, kl_limit, tolerance=kl_ucb_tolerance):
+    """
+    Function that finds, for every arm at once, the smallest u in [0, 1] with
+    the KL divergence in bits of Bernoulli(u) from Bernoulli(p) at most
+    kl_limit. The divergence decreases in u up to p, where it is 0, so the
+    bound is found by bisection on [0, p]. The returned bounds are on the
+    feasible side, within tolerance of the exact ones.
+
+    Parameter(s):
+        p: np.ndarray(float)
+        kl_limit: np.ndarray(float)
+        tolerance: float
+
+    Returns:
+        lower_bounds: np.ndarray(float)
+    """
+    p = np.asarray(p, dtype=float)
+    kl_limit = np.broadcast_to(np.asarray(kl_limit, dtype=float), p.shape)
+    low = np.zeros_like(p)
+    high = p.copy()
+    # u = 0 is only feasible for p = 0, where the divergence is 0.
+    while (high - low).max(initial=0) > tolerance:
+        middle = (low + high) / 2
+        feasible = bernoulli_kl(p, middle) <= kl_limit
+        high = np.where(feasible, middle, high)
+        low = np.where(feasible, low, middle)
+    return high
+
+
+def cvxpy_kl_lower_bound(p, kl_limit):
+    """
+    Function that finds the bound of kl_lower_bounds for a single arm as a
+    convex program. Kept as the reference to check kl_lower_bounds against;
+    cvxpy is only needed when it is called.
+    """
+    import cvxpy as cp
+
+    u = cp.Variable()
+    kl_d = (cp.kl_div(p, u) + cp.kl_div(1 - p, 1 - u)) / math.log(2)
+    constraints = [kl_d <= kl_limit,
+                   u <= 1,
+                   u >= 0]
+    prob = cp.Problem(cp.Minimize(u), constraints)
+    prob.solve()
+    return prob.value
+
+
 def kl_ucb_zpd(progression_graph,
                trace_problems_dict,
                kl_ucb_lower_threshold,
@@ -47,7 +106,8 @@ def kl_ucb_zpd(progression_graph,
                kl_ucb_n1,
                timeout,
                p_threshold,
-               student):
+               student,
+               reachability=None):
     
     def is_correct(problem, answer):
         return answer == problem[2]
@@ -60,8 +120,7 @@ def kl_ucb_zpd(progression_graph,
                        for trace
                        in traces}
     trace_node_dict[""] = KL_UCB_node(0, 1) # Jon Snow knows nothing.
-    log = f'Trace -> KL-UCB Node dictionary created.'
-    logger.info(log)
+    logger.info('Trace -> KL-UCB Node dictionary created.')
 
     # Create a dependency graph of traces. (Reverse of the progression graph.)
     dependency_graph = {}
@@ -72,47 +131,34 @@ def kl_ucb_zpd(progression_graph,
         for i in more_complex_traces:
             dependency_graph[i].append(trace)
 
-    log = f"Generated dependency graph: "
-    for trace, less_complex_trace in dependency_graph.items():
-        log += f"\n{trace} -> {less_complex_trace}"
-    logger.info(log)
-
-    # Create two maps One from trace to traces less-complex than it. Another 
-    # from trace to traces more-complex than it.
-    trace_to_less_complex_traces_dict = {}
-    trace_to_more_complex_traces_dict = {}
-    for trace in traces:
-        trace_to_less_complex_traces_dict[trace] = set()
-        trace_to_more_complex_traces_dict[trace] = set()
-
-    for trace in traces:
-        unadded_set = set(progression_graph[trace])
-        more_complex_traces_set = set()
-        while len(unadded_set) > 0:
-            elem = unadded_set.pop()
-            unadded_set |= set(progression_graph[elem])
-            more_complex_traces_set.add(elem)
-            trace_to_less_complex_traces_dict[elem].add(trace)
-        
-        trace_to_more_complex_traces_dict[trace] = more_complex_traces_set
+    logger.info("%s", lazy_mapping("Generated dependency graph: ",
+                                   dependency_graph))
 
-    log = f"Generated map from trace to less complex traces: "
-    for t, lct in trace_to_less_complex_traces_dict.items():
-        log += f"\n{t} -> {lct}"
-    logger.info(log)
+    # Two maps, one from trace to traces less-complex than it, another from
+    # trace to traces more-complex than it, shared between students through
+    # the reachability index of the curriculum.
+    if reachability is None:
+        reachability = ReachabilityIndex.from_progression_graph(
+                                                        progression_graph)
+    trace_to_less_complex_traces_dict = reachability.less_complex_dict
+    trace_to_more_complex_traces_dict = reachability.more_complex_dict
 
-    log = f"Generated map from trace to more complex traces: "
-    for t, mct in trace_to_more_complex_traces_dict.items():
-        log += f"\n{t} -> {mct}"
-    logger.info(log)
+    logger.info("%s", lazy_mapping(
+        "Generated map from trace to less complex traces: ",
+        trace_to_less_complex_traces_dict))
 
-    # Do topological ordering of the progression graph.
-    sorted_traces = sorted(traces, key=cmp_to_key(cmp_trace))
-    
-    log = f'Generalised topological sort of the traces.\n'
-    for trace in sorted_traces:
-        log += f'\nTrace - {trace}'
-    logger.info(log)
+    logger.info("%s", lazy_mapping(
+        "Generated map from trace to more complex traces: ",
+        trace_to_more_complex_traces_dict))
+
+    # Topological order of the progression graph, stored with the curriculum.
+    logger.info("%s", lazy_items('Generalised topological sort of the traces.\n',
+                                 reachability.ordered_traces(),
+                                 '\nTrace - {}'))
+
+    # Arms in a fixed order, for the lower bounds of all of them to be solved
+    # together.
+    arms = reachability.ordered_traces()
 
     # Run the kl-ucb bandit algorithm.
     # t = 1 is over when initialising the nodes.
@@ -121,34 +167,22 @@ def kl_ucb_zpd(progression_graph,
         # Create a dict that maps each max entropy value to the corresponding
         # traces.
         fp_traces_dict = defaultdict(set)
-        for trace in traces:
-            node = trace_node_dict[trace]
-            kl_limit = (math.log(1 + t * math.log(math.log(t, 2), 2), 2) /
-                        (node.n0_t0 + node.n1_t0))
-            # print(kl_limit)
-            u = cp.Variable()
-            kl_d = ((cp.kl_div(node.p_t0, u) + cp.kl_div(1 - node.p_t0, 1 - u))
-                     / math.log(2))
-            constraints = [kl_d <= kl_limit,
-                          u <= 1,
-                          u >= 0]
-#            obj = cp.Maximize((cp.entr(u) + cp.entr(1 - u)) / math.log(2))
-            obj = cp.Minimize(u)
-            # print(f"obj is dcp {obj.is_dcp()}") 
-            prob = cp.Problem(obj, constraints)
-            prob.solve()
-            # print(f"Trace {trace} and p:{u.value}")
-            if prob.value < kl_ucb_lower_threshold:
-                fp_traces_dict[prob.value].add(trace)
+        p = np.array([trace_node_dict[trace].p_t0 for trace in arms])
+        n = np.array([trace_node_dict[trace].n0_t0
+                      + trace_node_dict[trace].n1_t0 for trace in arms])
+        kl_limit = math.log(1 + t * math.log(math.log(t, 2), 2), 2) / n
+        lower_bounds = kl_lower_bounds(p, kl_limit)
+        for trace, fp in zip(arms, lower_bounds.tolist()):
+            if fp < kl_ucb_lower_threshold:
+                fp_traces_dict[fp].add(trace)
         
         if len(fp_traces_dict) == 0:
-            logger.info(f"No traces above kl_ucb_lower_threshold")
+            logger.info("No traces above kl_ucb_lower_threshold")
             continue
 
-        log = (f'f(p) for each trace calculated for round {t}.')
-        for fp, ts in fp_traces_dict.items():
-            log += f'\nfp: {fp} -> Traces: {ts}'
-        logger.info(log)
+        log_sampled(logger, t, "%s",
+                    lazy_mapping(f'f(p) for each trace calculated for round {t}.',
+                                 fp_traces_dict, '\nfp: {} -> Traces: {}'))
 
         # Select the trace with the maximum entropy among all traces, i.e. the
         # arm, in topological order.
@@ -157,10 +191,7 @@ def kl_ucb_zpd(progression_graph,
                                              key=itemgetter(0),
                                              reverse=True))
 
-        for trace in sorted_traces:
-            if trace in max_fp_traces_set:
-                trace_arm = trace
-                break
+        trace_arm = min(max_fp_traces_set, key=reachability.trace_rank)
 
         # Ask the student a problem corresponding to the chosen trace and record
         # the answer.
@@ -168,10 +199,9 @@ def kl_ucb_zpd(progression_graph,
         answer = student.solve(chosen_problem)
         node = trace_node_dict[trace_arm]
         
-        log = (f'\nMax fp: {max_fp}\nMax traces: {max_fp_traces_set}'
-               f'\nTrace-arm: {trace_arm}\nProblem: {chosen_problem}'
-               f'\nAnswer: {answer}')
-        logger.info(log)
+        logger.info('\nMax fp: %s\nMax traces: %s\nTrace-arm: %s'
+                    '\nProblem: %s\nAnswer: %s', max_fp, max_fp_traces_set,
+                    trace_arm, chosen_problem, answer)
         
         # Update the nodes of the algorithm according to the correctness of the 
         # answer.
@@ -203,10 +233,9 @@ def kl_ucb_zpd(progression_graph,
         for trace, node in trace_node_dict.items():
             node.update()
 
-        log = f'Updation of nodes completed.'
-        for trace, node in trace_node_dict.items():
-            log += f'\nTrace: {trace} -> Node: {node}'
-        logger.info(log)
+        log_sampled(logger, t, "%s",
+                    lazy_mapping('Updation of nodes completed.',
+                                 trace_node_dict, '\nTrace: {} -> Node: {}'))
 
         if all([s == KC_STATE.LEARNED for s in student.kc_states.values()]):
             print("Yipe")
@@ -0,0 +1,106 @@
+import logging
+
+from hyperparameters import log_every_n
+
+
+class LazyMessage(object):
+    """
+    Class for log message arguments that are only formatted when the record
+    is emitted. Passing one as a %-style argument to a logger call defers the
+    cost of building the message to the handlers, so nothing is formatted
+    when the level is disabled.
+    """
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def __str__(self):
+        return self.function(*self.args)
+
+
+def format_mapping(header, mapping, line="\n{} -> {}"):
+    """
+    Function that formats a dump of a dictionary, one item per line.
+
+    Parameter(s):
+        header: string, the first line of the message.
+        mapping: dict
+        line: string, the format of each key and value.
+
+    Returns:
+        message: string
+    """
+    return header + "".join(line.format(key, value)
+                            for key, value in mapping.items())
+
+
+def format_items(header, items, line="\n{}"):
+    """
+    Function that formats a dump of an iterable, one item per line.
+
+    Parameter(s):
+        header: string, the first line of the message.
+        items: iterable
+        line: string, the format of each item.
+
+    Returns:
+        message: string
+    """
+    return header + "".join(line.format(item) for item in items)
+
+
+def lazy_mapping(header, mapping, line="\n{} -> {}"):
+    """
+    Function that returns a dump of a dictionary, as format_mapping, that is
+    only formatted when the record is emitted.
+
+    Parameter(s):
+        header: string
+        mapping: dict
+        line: string
+
+    Returns:
+        message: LazyMessage
+    """
+    return LazyMessage(format_mapping, header, mapping, line)
+
+
+def lazy_items(header, items, line="\n{}"):
+    """
+    Function that returns a dump of an iterable, as format_items, that is
+    only formatted when the record is emitted.
+
+    Parameter(s):
+        header: string
+        items: iterable
+        line: string
+
+    Returns:
+        message: LazyMessage
+    """
+    return LazyMessage(format_items, header, items, line)
+
+
+def log_sampled(logger, iteration, msg, *args, level=logging.INFO,
+                every=None):
+    """
+    Function that logs a message only on every nth iteration of a loop, for
+    dumps too large to emit on each iteration.
+
+    Parameter(s):
+        logger: logging.Logger
+        iteration: int, the current iteration of the loop.
+        msg: string, the %-style format of the message.
+        args: arguments of msg.
+        level: int
+        every: int or None, log on the iterations divisible by every, by
+            default log_every_n. 0 disables the message.
+
+    Returns:
+        None
+    """
+    if every is None:
+        every = log_every_n
+    if every and iteration % every == 0 and logger.isEnabledFor(level):
+        logger.log(level, msg, *args)
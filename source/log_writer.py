@@ -0,0 +1,143 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+from logging.handlers import QueueHandler, QueueListener, \
+    RotatingFileHandler
+
+from hyperparameters import log_max_bytes, log_backup_count, log_queue_size, \
+    log_queue_block
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Class for handlers that put records on a bounded queue for a background
+    writer. When the queue is full the record is either dropped and counted,
+    or the logging call blocks until the writer catches up. Messages are
+    still formatted in the calling thread by prepare, as the algorithms mutate
+    the objects passed as arguments.
+    """
+
+    def __init__(self, log_queue, block=False):
+        super().__init__(log_queue)
+        self.block = block
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.block:
+            self.queue.put(record)
+            return
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BoundedQueueListener(QueueListener):
+    """
+    Class for queue listeners that wait for room on a full queue to stop,
+    instead of failing.
+    """
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Class for formatters that serialise each record to one line of JSON.
+    """
+
+    def format(self, record):
+        entry = {"time": record.created,
+                 "name": record.name,
+                 "function": record.funcName,
+                 "level": record.levelname,
+                 "message": record.getMessage()}
+        return json.dumps(entry)
+
+
+def gzip_namer(name):
+    """
+    Function that names the backups of a rotated log file as gzip files.
+
+    Parameter(s):
+        name: string, the default name of the backup.
+
+    Returns:
+        name: string
+    """
+    return name + ".gz"
+
+
+def gzip_rotator(source, dest):
+    """
+    Function that compresses a rotated log file into its backup.
+
+    Parameter(s):
+        source: string, the path of the log file being rotated.
+        dest: string, the path of the compressed backup.
+
+    Returns:
+        None
+    """
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class LogWriter(object):
+    """
+    Class for a logging pipeline where loggers only put records on a bounded
+    queue and a background thread writes them as JSON lines to a rotated log
+    file, with the rotated files compressed.
+    """
+
+    def __init__(self,
+                 log_file_path,
+                 level=logging.DEBUG,
+                 max_bytes=log_max_bytes,
+                 backup_count=log_backup_count,
+                 queue_size=log_queue_size,
+                 block=log_queue_block):
+        self.file_handler = RotatingFileHandler(log_file_path,
+                                                maxBytes=max_bytes,
+                                                backupCount=backup_count,
+                                                delay=True)
+        self.file_handler.namer = gzip_namer
+        self.file_handler.rotator = gzip_rotator
+        self.file_handler.setFormatter(StructuredFormatter())
+
+        self.handler = BoundedQueueHandler(queue.Queue(queue_size), block)
+        self.handler.setLevel(level)
+        self.listener = BoundedQueueListener(self.handler.queue, self.file_handler)
+
+    def start(self):
+        """
+        Method that starts a new log file, keeping the last run as a
+        backup, and starts the background writer.
+        """
+        if (os.path.exists(self.file_handler.baseFilename)
+            and os.path.getsize(self.file_handler.baseFilename) > 0):
+            self.file_handler.doRollover()
+        self.listener.start()
+
+    def stop(self):
+        """
+        Method that writes out the queued records, stops the background
+        writer and records the number of dropped records.
+        """
+        self.listener.stop()
+        if self.handler.dropped > 0:
+            record = logging.makeLogRecord({
+                        "name": "zpd.log_writer",
+                        "funcName": "stop",
+                        "levelno": logging.WARNING,
+                        "levelname": "WARNING",
+                        "msg": f"Dropped {self.handler.dropped} log records, "
+                               f"the log queue was full."})
+            self.file_handler.handle(record)
+        self.file_handler.close()
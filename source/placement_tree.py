@@ -0,0 +1,287 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+import init_zpd
+import reachability as reachability_module
+from init_zpd import Placement, is_correct, place_student
+from lazy_log import lazy_items
+
+logger = logging.getLogger(f"zpd.{__name__}")
+logger.setLevel(logging.DEBUG)
+
+# Arrays making up a placement tree, each stored as <name>.npy.
+placement_tree_arrays = ("trace_ids", "children", "zpd_indptr",
+                         "zpd_indices")
+
+# Child of a node not compiled, placement falls back to live computation.
+not_compiled = -1
+
+
+class PlacementTree():
+    """
+    Class for the initial_zpd placement policy of a curriculum expanded into
+    a decision tree. Node k asks about trace_ids[k] and continues at
+    children[k, 1] after a correct answer and children[k, 0] after an
+    incorrect one. Nodes where placement has finished have trace ID -1 and
+    their zpd in zpd_indices[zpd_indptr[k]:zpd_indptr[k + 1]]. Node 0 is the
+    root.
+    """
+
+    def __init__(self,
+                 trace_ids,
+                 children,
+                 zpd_indptr,
+                 zpd_indices,
+                 regularisation_0,
+                 entropy_threshold,
+                 depth):
+        self.trace_ids = trace_ids
+        self.children = children
+        self.zpd_indptr = zpd_indptr
+        self.zpd_indices = zpd_indices
+        self.regularisation_0 = regularisation_0
+        self.entropy_threshold = entropy_threshold
+        self.depth = depth
+
+    def zpd(self, node, traces):
+        """
+        Function that returns the zpd of a finished node as a set of traces.
+        """
+        indices = self.zpd_indices[self.zpd_indptr[node]:
+                                   self.zpd_indptr[node + 1]]
+        return {traces[i] for i in indices.tolist()}
+
+    def __repr__(self):
+        return (f"PlacementTree(n_nodes={len(self.trace_ids)}, "
+                f"depth={self.depth})")
+
+
+def compile_placement_tree(reachability,
+                           trace_problems_dict,
+                           regularisation_0,
+                           entropy_threshold,
+                           depth):
+    """
+    Function that expands the initial_zpd placement policy into a decision
+    tree covering every answer history of up to depth answers. The selection
+    rule is deterministic, so the question asked depends only on the earlier
+    answers and every node is found by recording one answer on a copy of its
+    parent's placement.
+
+    Parameter(s):
+        reachability: ReachabilityIndex
+        trace_problems_dict: dict(string -> list(int, int, int, string))
+        regularisation_0: float
+        entropy_threshold: float
+        depth: int
+
+    Returns:
+        tree: PlacementTree
+    """
+    trace_id_dict = reachability.trace_id_dict
+    trace_ids = []
+    children = []
+    zpds = []
+
+    def add_node(placement):
+        trace_ids.append(-1 if placement.finished()
+                         else int(placement.select()))
+        children.append([not_compiled, not_compiled])
+        zpds.append([trace_id_dict[t] for t in placement.zpd()]
+                    if placement.finished() else [])
+        return len(trace_ids) - 1
+
+    root = Placement(reachability,
+                     trace_problems_dict,
+                     regularisation_0,
+                     entropy_threshold)
+    frontier = [(add_node(root), root)]
+    for _ in range(depth):
+        next_frontier = []
+        for node, placement in frontier:
+            trace_id = trace_ids[node]
+            if trace_id < 0:
+                continue
+            placement.next_problem(trace_id)
+            for correctness in (False, True):
+                child = placement.copy()
+                child.record(trace_id, correctness)
+                children[node][correctness] = add_node(child)
+                next_frontier.append((children[node][correctness], child))
+        frontier = next_frontier
+
+    zpd_indptr = np.zeros(len(zpds) + 1, dtype=np.int64)
+    zpd_indptr[1:] = np.cumsum([len(zpd) for zpd in zpds])
+    tree = PlacementTree(np.array(trace_ids, dtype=np.int32),
+                         np.array(children, dtype=np.int32).reshape(-1, 2),
+                         zpd_indptr,
+                         np.array([i for zpd in zpds for i in zpd],
+                                  dtype=np.int32),
+                         regularisation_0,
+                         entropy_threshold,
+                         depth)
+
+    logger.info("Compiled %s.", tree)
+
+    return tree
+
+
+def save_placement_tree(tree_dir, tree):
+    """
+    Function that writes a placement tree as .npy files and its parameters as
+    JSON.
+    """
+    os.makedirs(tree_dir, exist_ok=True)
+    for name in placement_tree_arrays:
+        np.save(os.path.join(tree_dir, f"{name}.npy"), getattr(tree, name))
+    with open(os.path.join(tree_dir, "parameters.json"), "w") as f:
+        json.dump({"regularisation_0": tree.regularisation_0,
+                   "entropy_threshold": tree.entropy_threshold,
+                   "depth": tree.depth}, f)
+
+    return None
+
+
+def load_placement_tree(tree_dir):
+    """
+    Function that memory maps a placement tree written by
+    save_placement_tree.
+    """
+    arrays = {name: np.load(os.path.join(tree_dir, f"{name}.npy"),
+                            mmap_mode="r")
+              for name in placement_tree_arrays}
+    with open(os.path.join(tree_dir, "parameters.json")) as f:
+        parameters = json.load(f)
+
+    return PlacementTree(**arrays, **parameters)
+
+
+def placement_tree_key(regularisation_0, entropy_threshold, depth):
+    """
+    Function that returns a hash of the parameters of a placement tree and of
+    the code of the placement policy, so that trees are compiled again when
+    either changes.
+    """
+    digest = hashlib.sha256(json.dumps([regularisation_0,
+                                        entropy_threshold,
+                                        depth]).encode())
+    for path in (init_zpd.__file__, reachability_module.__file__, __file__):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+def cached_placement_tree(curriculum,
+                          regularisation_0,
+                          entropy_threshold,
+                          depth):
+    """
+    Function that returns the placement tree of a curriculum, loaded from the
+    curriculum's directory when compiled before and otherwise compiled and
+    stored there. A curriculum not loaded from a directory has its tree
+    compiled every time.
+
+    Parameter(s):
+        curriculum: curriculum_store.Curriculum
+        regularisation_0: float
+        entropy_threshold: float
+        depth: int
+
+    Returns:
+        tree: PlacementTree
+    """
+    tree_dir = None
+    if curriculum.directory is not None:
+        key = placement_tree_key(regularisation_0, entropy_threshold, depth)
+        tree_dir = os.path.join(curriculum.directory, f"placement_tree_{key}")
+        if os.path.isdir(tree_dir):
+            return load_placement_tree(tree_dir)
+
+    tree = compile_placement_tree(curriculum.reachability_index(),
+                                  curriculum.trace_problems_dict,
+                                  regularisation_0,
+                                  entropy_threshold,
+                                  depth)
+    if tree_dir is None:
+        return tree
+
+    partial_dir = f"{tree_dir}.{os.getpid()}.partial"
+    save_placement_tree(partial_dir, tree)
+    try:
+        os.replace(partial_dir, tree_dir)
+    except OSError:
+        # A concurrent run stored the same tree first.
+        shutil.rmtree(partial_dir, ignore_errors=True)
+
+    return tree
+
+
+def precompiled_initial_zpd(tree,
+                            reachability,
+                            trace_problems_dict,
+                            student):
+    """
+    Function that computes the initial zpd for a student object by walking a
+    placement tree, one pointer per answer. When the answers lead past the
+    compiled depth, they are replayed on a live placement, which carries on
+    as initial_zpd does. The result is the same as initial_zpd with the
+    parameters of the tree.
+
+    Parameter(s):
+        tree: PlacementTree
+        reachability: ReachabilityIndex
+        trace_problems_dict: dict(string -> list(int, int, int, string))
+        student: Student
+
+    Returns:
+        zpd: set(string)
+    """
+    traces = reachability.traces
+    asked = {}
+    answers = []
+    node = 0
+    while node != not_compiled and tree.trace_ids[node] >= 0:
+        trace_id = int(tree.trace_ids[node])
+        problems = trace_problems_dict[traces[trace_id]]
+        problem = problems[asked.get(trace_id, 0) % len(problems)]
+        asked[trace_id] = asked.get(trace_id, 0) + 1
+
+        answer = student.solve(problem)
+        correctness = is_correct(problem, answer)
+        answers.append((trace_id, correctness))
+
+        logger.info("Chosen trace: %s, chosen problem: %s,answer: %s, "
+                    "Is correct: %s", traces[trace_id], problem, answer,
+                    correctness)
+
+        node = int(tree.children[node, int(correctness)])
+
+    if node != not_compiled:
+        zpd = tree.zpd(node, traces)
+        problem_count = len(answers)
+    else:
+        logger.info("Placement tree exhausted after %s answers, continuing "
+                    "live.", len(answers))
+        placement = Placement(reachability,
+                              trace_problems_dict,
+                              tree.regularisation_0,
+                              tree.entropy_threshold)
+        for trace_id, correctness in answers:
+            placement.next_problem(trace_id)
+            placement.record(trace_id, correctness)
+        place_student(placement, student)
+        zpd = placement.zpd()
+        problem_count = placement.problem_count
+
+    logger.info("%s", lazy_items("Generated initial ZPD: ", zpd,
+                                 "\nTrace: {}"))
+    logger.info("Number of problems asked: %s", problem_count)
+    print(f"Init ZPD: {problem_count}")
+
+    return zpd
@@ -0,0 +1,307 @@
+from collections import deque
+from collections.abc import Mapping
+import logging
+
+import numpy as np
+
+from compare_traces import complexity_matrix, signature_classes
+
+logger = logging.getLogger(f"zpd.{__name__}")
+logger.setLevel(logging.DEBUG)
+
+
+def progression_csr(progression_graph):
+    """
+    Function that interns the traces of a progression graph as integer IDs
+    and returns its adjacency in CSR form. IDs follow the sorted traces, not
+    the order of the graph, which can come from set iteration and change
+    with the hash seed, so ties broken by ID are the same in every process.
+
+    Parameter(s):
+        progression_graph: dict(string -> list(string))
+
+    Returns:
+        traces: list(string), the trace of every ID.
+        indptr: np.ndarray(int64, shape=(N + 1,))
+        indices: np.ndarray(int32), the IDs of the traces following trace i
+            being indices[indptr[i]:indptr[i + 1]].
+    """
+    traces = sorted(progression_graph)
+    trace_id_dict = {trace: i for i, trace in enumerate(traces)}
+    indptr = np.zeros(len(traces) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(progression_graph[t]) for t in traces])
+    indices = np.array([trace_id_dict[t]
+                        for trace in traces
+                        for t in progression_graph[trace]], dtype=np.int32)
+
+    return traces, indptr, indices
+
+
+def transpose_csr(indptr, indices):
+    """
+    Function that returns the CSR adjacency of the reversed graph.
+    """
+    n = len(indptr) - 1
+    sources = np.repeat(np.arange(n, dtype=np.int32), np.diff(indptr))
+    order = np.argsort(indices, kind="stable")
+    reversed_indptr = np.zeros(n + 1, dtype=np.int64)
+    reversed_indptr[1:] = np.cumsum(np.bincount(indices, minlength=n))
+
+    return reversed_indptr, sources[order]
+
+
+def topological_order(indptr, indices):
+    """
+    Function that sorts the nodes of a DAG topologically with Kahn's
+    algorithm, taking nodes in ID order among those that are ready.
+
+    Parameter(s):
+        indptr: np.ndarray(int)
+        indices: np.ndarray(int)
+
+    Returns:
+        order: np.ndarray(int32, shape=(N,))
+    """
+    n = len(indptr) - 1
+    in_degree = np.bincount(indices, minlength=n)
+    ready = deque(np.flatnonzero(in_degree == 0).tolist())
+    in_degree = in_degree.tolist()
+    order = []
+    while ready:
+        i = ready.popleft()
+        order.append(i)
+        for j in indices[indptr[i]:indptr[i + 1]].tolist():
+            in_degree[j] -= 1
+            if in_degree[j] == 0:
+                ready.append(j)
+
+    if len(order) != n:
+        raise ValueError("The progression graph has a cycle.")
+
+    return np.array(order, dtype=np.int32)
+
+
+def levelized_order(indptr, indices):
+    """
+    Function that computes the depth level of every node of a DAG, the
+    length of the longest path to it from a node without predecessors, and a
+    topological order sorting the nodes by level and then by ID.
+
+    Parameter(s):
+        indptr: np.ndarray(int)
+        indices: np.ndarray(int)
+
+    Returns:
+        order: np.ndarray(int32, shape=(N,))
+        levels: np.ndarray(int32, shape=(N,))
+    """
+    n = len(indptr) - 1
+    levels = np.zeros(n, dtype=np.int32)
+    for i in topological_order(indptr, indices).tolist():
+        successors = indices[indptr[i]:indptr[i + 1]]
+        levels[successors] = np.maximum(levels[successors], levels[i] + 1)
+
+    # Every edge goes to a higher level, so sorting by level is topological.
+    order = np.lexsort((np.arange(n), levels)).astype(np.int32)
+
+    return order, levels
+
+
+def closure_bitsets(indptr, indices, order):
+    """
+    Function that computes, for every node of a DAG, the bitset of nodes
+    reachable from it. Nodes are visited in reverse topological order and
+    nodes with the same successors share one row, which keeps the many
+    traces of a signature class to one computation.
+
+    Parameter(s):
+        indptr: np.ndarray(int)
+        indices: np.ndarray(int)
+        order: np.ndarray(int), a topological order of the nodes.
+
+    Returns:
+        node_rows: np.ndarray(int64, shape=(N,)), the row of every node.
+        rows: np.ndarray(uint8, shape=(R, ceil(N / 8))), packed bitsets.
+    """
+    n = len(indptr) - 1
+    node_rows = np.zeros(n, dtype=np.int64)
+    rows = []
+    successors_row_dict = {}
+    for i in order[::-1].tolist():
+        successors = np.sort(indices[indptr[i]:indptr[i + 1]])
+        key = successors.tobytes()
+        row = successors_row_dict.get(key)
+        if row is None:
+            bits = np.zeros(n, dtype=bool)
+            bits[successors] = True
+            packed = np.packbits(bits)
+            for r in np.unique(node_rows[successors]).tolist():
+                packed |= rows[r]
+            row = len(rows)
+            rows.append(packed)
+            successors_row_dict[key] = row
+        node_rows[i] = row
+
+    packed_width = (n + 7) // 8
+    return node_rows, np.array(rows, dtype=np.uint8).reshape(-1,
+                                                             packed_width)
+
+
+class ReachabilityIndex():
+    """
+    Class for the complexity relations of a curriculum as bitsets over
+    integer trace IDs, computed once and shared by every ZPD estimator and
+    student. descendants and ancestors are the traces more and less complex
+    than a trace in the progression graph. at_least and at_most are the
+    traces at least and at most as complex by atleast_complex, computed once
+    per signature class. The start trace "" is never part of the sets.
+    """
+
+    def __init__(self, traces, indptr, indices, order=None, levels=None):
+        self.traces = list(traces)
+        self.trace_id_dict = {t: i for i, t in enumerate(self.traces)}
+        self.indptr = indptr
+        self.indices = indices
+        n = len(self.traces)
+
+        # Levelized topological order, as stored with the curriculum.
+        if order is None or levels is None:
+            order, levels = levelized_order(indptr, indices)
+        self.order = np.asarray(order)
+        self.levels = np.asarray(levels)
+        self.rank = np.empty(n, dtype=np.int64)
+        self.rank[self.order] = np.arange(n)
+
+        # Mask clearing the start trace from every set.
+        mask = np.ones(n, dtype=bool)
+        if "" in self.trace_id_dict:
+            mask[self.trace_id_dict[""]] = False
+        self.mask = np.packbits(mask)
+
+        order = self.order
+        self.descendant_rows, self.descendants = closure_bitsets(indptr,
+                                                                 indices,
+                                                                 order)
+        reversed_indptr, reversed_indices = transpose_csr(indptr, indices)
+        self.ancestor_rows, self.ancestors = closure_bitsets(reversed_indptr,
+                                                             reversed_indices,
+                                                             order[::-1])
+
+        # atleast_complex is the same for traces with the same signature, so
+        # it is only computed between one trace per class.
+        self.classes, representatives = signature_classes(self.traces)
+        relation = complexity_matrix([self.traces[r]
+                                      for r in representatives])
+        # Row c holds the traces at least (at most) as complex as class c.
+        self.at_least = np.packbits(relation[self.classes].T, axis=1)
+        self.at_most = np.packbits(relation[:, self.classes], axis=1)
+        self.class_relation = relation
+
+        # Number of traces in each class, and in the classes at most and at
+        # least as complex as each class, without the start trace.
+        self.class_sizes = np.bincount(self.classes,
+                                       weights=np.unpackbits(self.mask)[:n],
+                                       minlength=len(representatives))
+        self.at_most_sizes = relation @ self.class_sizes
+        self.at_least_sizes = self.class_sizes @ relation
+
+        self.more_complex_dict = ReachabilityView(self, self.more_complex)
+        self.less_complex_dict = ReachabilityView(self, self.less_complex)
+        self.at_least_complex_dict = ReachabilityView(self,
+                                                      self.at_least_complex)
+        self.at_most_complex_dict = ReachabilityView(self,
+                                                     self.at_most_complex)
+
+        log = (f"Built reachability index of {n} traces, "
+               f"{len(self.descendants)} descendant and "
+               f"{len(self.ancestors)} ancestor rows, "
+               f"{len(representatives)} signature classes.")
+        logger.info(log)
+
+    @classmethod
+    def from_progression_graph(cls, progression_graph):
+        return cls(*progression_csr(progression_graph))
+
+    def trace_rank(self, trace):
+        """
+        Function that returns the position of trace in the topological order.
+        """
+        return self.rank[self.trace_id_dict[trace]]
+
+    def ordered_traces(self):
+        """
+        Function that returns the traces in topological order, without the
+        start trace.
+        """
+        return [self.traces[i] for i in self.order.tolist()
+                if self.traces[i] != ""]
+
+    def trace_set(self, packed, trace):
+        """
+        Function that returns the traces in a packed bitset, without trace
+        itself and the start trace.
+        """
+        bits = np.unpackbits(packed & self.mask)[:len(self.traces)]
+        bits[self.trace_id_dict[trace]] = 0
+        return frozenset(self.traces[i] for i in np.flatnonzero(bits))
+
+    def more_complex(self, trace):
+        """
+        Function that returns the traces reachable from trace in the
+        progression graph.
+        """
+        row = self.descendant_rows[self.trace_id_dict[trace]]
+        return self.trace_set(self.descendants[row], trace)
+
+    def less_complex(self, trace):
+        """
+        Function that returns the traces trace is reachable from in the
+        progression graph.
+        """
+        row = self.ancestor_rows[self.trace_id_dict[trace]]
+        return self.trace_set(self.ancestors[row], trace)
+
+    def at_least_complex(self, trace):
+        """
+        Function that returns the other traces at least as complex as trace.
+        """
+        c = self.classes[self.trace_id_dict[trace]]
+        return self.trace_set(self.at_least[c], trace)
+
+    def at_most_complex(self, trace):
+        """
+        Function that returns the other traces at most as complex as trace.
+        """
+        c = self.classes[self.trace_id_dict[trace]]
+        return self.trace_set(self.at_most[c], trace)
+
+    def __repr__(self):
+        return f"ReachabilityIndex(n_traces={len(self.traces)})"
+
+
+class ReachabilityView(Mapping):
+    """
+    Class for a read-only trace keyed mapping over a ReachabilityIndex,
+    caching the sets it has built. The start trace is not a key.
+    """
+
+    def __init__(self, index, get_value):
+        self.index = index
+        self.get_value = get_value
+        self.cache = {}
+
+    def __getitem__(self, trace):
+        value = self.cache.get(trace)
+        if value is None:
+            value = self.get_value(trace)
+            self.cache[trace] = value
+        return value
+
+    def __iter__(self):
+        return (t for t in self.index.traces if t != "")
+
+    def __len__(self):
+        return len(self.index.traces) - ("" in self.index.trace_id_dict)
+
+    def __contains__(self, trace):
+        return trace != "" and trace in self.index.trace_id_dict
@@ -0,0 +1,104 @@
+from hyperparameters import action_tag_dict, ngram_size
+
+# Traces are packed into integers with 2 bits per action, the first action in
+# the most significant position. A leading 1 bit marks the length so that
+# traces with leading "A"s (code 0) stay distinct, e.g. "" -> 0b1,
+# "A" -> 0b100 and "AB" -> 0b10001.
+tag_code_dict = {tag: code for code, tag in enumerate(action_tag_dict.values())}
+code_tag_dict = {code: tag for tag, code in tag_code_dict.items()}
+
+
+def encode_trace(trace):
+    """
+    Function takes a trace string and returns its packed encoding.
+
+    Parameter(s):
+        trace: string
+
+    Returns:
+        code: int
+    """
+    code = 1
+    for tag in trace:
+        code = (code << 2) | tag_code_dict[tag]
+
+    return code
+
+
+def decode_trace(code):
+    """
+    Function takes a packed trace and returns the trace string.
+
+    Parameter(s):
+        code: int
+
+    Returns:
+        trace: string
+    """
+    tags = []
+    while code > 1:
+        tags.append(code_tag_dict[code & 3])
+        code >>= 2
+
+    return "".join(reversed(tags))
+
+
+def packed_length(code):
+    """
+    Function takes a packed trace and returns the number of actions in it.
+
+    Parameter(s):
+        code: int
+
+    Returns:
+        n_actions: int
+    """
+    return (code.bit_length() - 1) // 2
+
+
+def packed_ngrams(code, n=ngram_size):
+    """
+    Function takes a packed trace and splits it into n sized contiguous
+    pieces, themselves packed. A trace shorter than n is its only piece.
+
+    Parameter(s):
+        code: int
+        n: int
+
+    Returns:
+        n_grams: set(int)
+    """
+    length = packed_length(code)
+    if length < n:
+        return {code}
+
+    actions = code ^ (1 << 2 * length)
+    mask = (1 << 2 * n) - 1
+    marker = 1 << 2 * n
+    return {((actions >> 2 * i) & mask) | marker
+            for i in range(length - n + 1)}
+
+
+def packed_contains(code, sub_code):
+    """
+    Function that checks whether the packed trace sub_code is a contiguous
+    piece of the packed trace code, the packed counterpart of
+    "sub_trace in trace".
+
+    Parameter(s):
+        code: int
+        sub_code: int
+
+    Returns:
+        result: bool
+    """
+    length = packed_length(code)
+    sub_length = packed_length(sub_code)
+    if sub_length > length:
+        return False
+
+    actions = code ^ (1 << 2 * length)
+    sub_actions = sub_code ^ (1 << 2 * sub_length)
+    mask = (1 << 2 * sub_length) - 1
+    return any(((actions >> 2 * i) & mask) == sub_actions
+               for i in range(length - sub_length + 1))
@@ -2,6 +2,8 @@ from random import choices
 from collections import defaultdict, deque
 import logging
 
+from lazy_log import lazy_mapping, log_sampled
+
 # TODO: Clarify substitution of problems with traces in the zpdes algorithm unlike in the paper.
 # TODO: Clarify Correctness values.
 
@@ -139,10 +141,8 @@ def zpdes(init_zpd,
     for trace in init_zpd:
         zpdes_trace_node_dict[trace] = ZPDES_Node(w0, d)
 
-    log = f"ZPDES nodes generated."
-    for trace, node in zpdes_trace_node_dict.items():
-        log += f"\n{trace} -> NODE: {node}"
-    logger.info(log)
+    logger.info("%s", lazy_mapping("ZPDES nodes generated.",
+                                   zpdes_trace_node_dict, "\n{} -> NODE: {}"))
 
     while len(zpdes_trace_node_dict) > 0:
         # print(len(zpdes_trace_node_dict))
@@ -150,10 +150,9 @@ def zpdes(init_zpd,
         traces, probabilities = zip(*trace_probability_dict.items())
         [chosen_trace] = choices(traces, weights=probabilities)
         
-        log = f"Generated trace probabilities."
-        for t, p in trace_probability_dict.items():
-            log += f"\ntrace: {t}; p:{p}"
-        logger.info(log)
+        log_sampled(logger, problem_count, "%s",
+                    lazy_mapping("Generated trace probabilities.",
+                                 trace_probability_dict, "\ntrace: {}; p:{}"))
 
         # Select a problem from the problem list of the chosen_trace consecutively
         # and loop around the list when exhausted. 
@@ -169,9 +168,8 @@ def zpdes(init_zpd,
         chosen_node = zpdes_trace_node_dict[chosen_trace]
         chosen_node.record_correctness(correctness)
         
-        log = (f"chosen trace: {chosen_trace}, problem: {problem}"
-               f", answer:{answer}, Is correct: {correctness}")
-        logger.info(log)
+        logger.info("chosen trace: %s, problem: %s, answer:%s, Is correct: %s",
+                    chosen_trace, problem, answer, correctness)
 
         reward = calculate_reward(chosen_node)
         chosen_node.weight = (beta * chosen_node.weight + eta * reward)
@@ -185,12 +183,11 @@ def zpdes(init_zpd,
             del zpdes_trace_node_dict[chosen_trace]
             # del trace_problemIters_dict[chosen_trace]
         
-        log  = f"Updated trace node dictionary."
-        for trace, node in zpdes_trace_node_dict.items():
-            log += f"\n{trace} -> NODE: {node}"
-        logger.info(log)
+        log_sampled(logger, problem_count, "%s",
+                    lazy_mapping("Updated trace node dictionary.",
+                                 zpdes_trace_node_dict, "\n{} -> NODE: {}"))
     
-    logger.info(f"Number of problems asked: {problem_count}")
+    logger.info("Number of problems asked: %s", problem_count)
     print(f"Zpdes: {problem_count}")
 
     return   
\ No newline at end of file
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules import each other by name from the source folder.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir,
+                                "source"))
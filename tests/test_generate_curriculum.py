@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+from compare_traces import cmp_trace, cmp_matrix, more_complex_classes
+from generate_curriculum import form_progression, insert_trace, \
+    update_curriculum
+from generate_trace import enumerate_2digitaddition_traces
+
+
+def catalog_traces(ndigits):
+    traces = {""}
+    for ndigit in ndigits:
+        traces |= set(enumerate_2digitaddition_traces(ndigit))
+    return traces
+
+
+def as_sets(progression_graph):
+    return {trace: set(more_complex_traces)
+            for trace, more_complex_traces in progression_graph.items()}
+
+
+@pytest.fixture(scope="module")
+def pairwise_progression():
+    # The pair by pair comparison and trimming of form_progression.
+    return as_sets(form_progression(catalog_traces(range(1, 6)), cmp_trace))
+
+
+def test_matrix_progression_matches_pairwise(pairwise_progression):
+    progression_graph = form_progression(catalog_traces(range(1, 6)),
+                                         cmp_trace,
+                                         cmp_matrix=cmp_matrix)
+    assert as_sets(progression_graph) == pairwise_progression
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_class_progression_matches_pairwise(pairwise_progression, n_workers):
+    progression_graph = form_progression(
+                                catalog_traces(range(1, 6)),
+                                cmp_trace,
+                                more_complex_classes=more_complex_classes,
+                                n_workers=n_workers)
+    assert as_sets(progression_graph) == pairwise_progression
+
+
+def test_insert_trace_matches_rebuild(pairwise_progression):
+    traces = sorted(catalog_traces(range(1, 6)))
+    random.Random(0).shuffle(traces)
+    initial_traces = set(traces[:20]) | {""}
+    progression_graph = form_progression(initial_traces, cmp_trace)
+    for trace in traces:
+        if trace not in initial_traces:
+            insert_trace(progression_graph, trace, cmp_trace)
+
+    assert as_sets(progression_graph) == pairwise_progression
+
+
+def test_update_curriculum_matches_rebuild():
+    traces = sorted(catalog_traces(range(1, 5)) - {""})
+    rows = [(i, 0, i, trace) for i, trace in enumerate(traces)]
+    trace_problems_dict = {"": []}
+    trace_problems_dict.update({row[3]: [row] for row in rows[:10]})
+    progression_graph = form_progression(set(trace_problems_dict),
+                                         cmp_trace)
+
+    # Problems of known traces are appended, only new traces are inserted.
+    new_traces = update_curriculum(progression_graph,
+                                   trace_problems_dict,
+                                   rows[5:] + rows[:2],
+                                   cmp_trace)
+
+    assert new_traces == traces[10:]
+    assert trace_problems_dict[traces[0]] == [rows[0], rows[0]]
+    assert (as_sets(progression_graph)
+            == as_sets(form_progression(set(traces) | {""}, cmp_trace)))
@@ -0,0 +1,170 @@
+import io
+import random
+from collections import defaultdict
+from contextlib import redirect_stdout
+
+import pytest
+
+from compare_traces import atleast_complex, cmp_trace, more_complex_classes
+from generate_curriculum import form_progression
+from generate_trace import enumerate_2digitaddition_traces
+from init_zpd import Colour, Node_initZPD, initial_zpd, initial_zpd_cohort
+from reachability import ReachabilityIndex
+
+regularisation_0 = 4
+entropy_threshold = 0.35
+
+
+class FakeStudent():
+    """
+    Student answering the problems of the known traces correctly and the
+    others incorrectly, recording the problems asked.
+    """
+
+    def __init__(self, known):
+        self.known = known
+        self.asked = []
+
+    def solve(self, problem):
+        self.asked.append(problem)
+        return problem[2] if problem[3] in self.known else -1
+
+
+@pytest.fixture(scope="module")
+def curriculum():
+    traces = {""}
+    for ndigit in range(1, 5):
+        traces |= set(enumerate_2digitaddition_traces(ndigit))
+    progression_graph = form_progression(
+                                traces,
+                                cmp_trace,
+                                more_complex_classes=more_complex_classes)
+    trace_problems_dict = {t: [(i, 0, i, t), (i, 1, i + 1, t)]
+                           for i, t in enumerate(sorted(traces))}
+    reachability = ReachabilityIndex.from_progression_graph(progression_graph)
+    return progression_graph, trace_problems_dict, reachability
+
+
+def closure(graph, trace):
+    reached = set()
+    stack = list(graph[trace])
+    while stack:
+        t = stack.pop()
+        if t not in reached:
+            reached.add(t)
+            stack.extend(graph[t])
+    return reached
+
+
+def reference_initial_zpd(progression_graph,
+                          trace_problems_dict,
+                          student,
+                          reachability):
+    # init_zpd with every split weight summed again for every question.
+    # Ties go to the first trace in the topological order of reachability.
+    traces = [t for t in progression_graph if t != ""]
+    dependency_graph = defaultdict(list)
+    for trace, more_complex_traces in progression_graph.items():
+        for t in more_complex_traces:
+            dependency_graph[t].append(trace)
+    more_complex = {t: closure(progression_graph, t) - {""} for t in traces}
+    less_complex = {t: closure(dependency_graph, t) - {""} for t in traces}
+
+    nodes = {t: Node_initZPD(regularisation_0) for t in traces}
+    uncoloured = set(traces)
+    asked = defaultdict(int)
+    while uncoloured:
+        max_min_weight = 0
+        chosen = min(uncoloured, key=reachability.trace_rank)
+        for t1 in sorted(uncoloured, key=reachability.trace_rank):
+            plus = sum(nodes[t2].weight for t2 in uncoloured
+                       if t2 != t1 and atleast_complex(t1, t2))
+            minus = sum(nodes[t2].weight for t2 in uncoloured
+                        if t2 != t1 and atleast_complex(t2, t1))
+            if min(plus, minus) > max_min_weight + 1e-9:
+                max_min_weight = min(plus, minus)
+                chosen = t1
+
+        problems = trace_problems_dict[chosen]
+        problem = problems[asked[chosen] % len(problems)]
+        asked[chosen] += 1
+        correct = student.solve(problem) == problem[2]
+
+        dependencies = less_complex if correct else more_complex
+        for t in {chosen} | (dependencies[chosen] & uncoloured):
+            nodes[t].update_correctness(correct)
+            nodes[t].update_weight()
+        for t in list(uncoloured):
+            if nodes[t].weight < entropy_threshold:
+                nodes[t].colour = (Colour.SOLVABLE if nodes[t].c > 0
+                                   else Colour.UNSOLVABLE)
+                uncoloured.remove(t)
+
+    solvable = {t for t, node in nodes.items()
+                if node.colour == Colour.SOLVABLE}
+    if not solvable:
+        return set(progression_graph[""])
+    zpd = set()
+    for trace in solvable:
+        unsolved = set(progression_graph[trace]) - solvable
+        if unsolved:
+            zpd |= unsolved | {trace}
+    return zpd
+
+
+def known_traces(reachability, seed):
+    # Traces known by a student who knows a few traces and every trace less
+    # complex than them.
+    rng = random.Random(seed)
+    traces = [t for t in reachability.traces if t != ""]
+    known = set()
+    for trace in rng.sample(traces, rng.randrange(4)):
+        known |= {trace} | reachability.less_complex(trace)
+    return known
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_initial_zpd_matches_reference(curriculum, seed):
+    progression_graph, trace_problems_dict, reachability = curriculum
+    known = known_traces(reachability, seed)
+    student = FakeStudent(known)
+    reference_student = FakeStudent(known)
+
+    with redirect_stdout(io.StringIO()):
+        zpd = initial_zpd(progression_graph,
+                          trace_problems_dict,
+                          regularisation_0,
+                          entropy_threshold,
+                          student,
+                          reachability)
+    reference_zpd = reference_initial_zpd(progression_graph,
+                                          trace_problems_dict,
+                                          reference_student,
+                                          reachability)
+
+    assert student.asked == reference_student.asked
+    assert zpd == reference_zpd
+
+
+def test_cohort_matches_single_students(curriculum):
+    progression_graph, trace_problems_dict, reachability = curriculum
+    knowns = [known_traces(reachability, seed) for seed in range(6)]
+    students = [FakeStudent(known) for known in knowns]
+
+    zpds = initial_zpd_cohort(progression_graph,
+                              trace_problems_dict,
+                              regularisation_0,
+                              entropy_threshold,
+                              students,
+                              reachability)
+
+    for known, student, zpd in zip(knowns, students, zpds):
+        single_student = FakeStudent(known)
+        with redirect_stdout(io.StringIO()):
+            assert zpd == initial_zpd(progression_graph,
+                                      trace_problems_dict,
+                                      regularisation_0,
+                                      entropy_threshold,
+                                      single_student,
+                                      reachability)
+        assert student.asked == single_student.asked
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from kl_ucb_zpd import bernoulli_kl, cvxpy_kl_lower_bound, kl_lower_bounds
+
+grid_p = np.linspace(0, 1, 11)
+grid_kl_limit = np.array([0, 0.01, 0.1, 0.5, 2])
+
+
+def test_kl_lower_bounds_match_cvxpy():
+    pytest.importorskip("cvxpy")
+    p, kl_limit = (a.ravel() for a in np.meshgrid(grid_p, grid_kl_limit))
+    expected = [cvxpy_kl_lower_bound(*arm) for arm in zip(p, kl_limit)]
+
+    np.testing.assert_allclose(kl_lower_bounds(p, kl_limit), expected,
+                               atol=1e-5)
+
+
+def test_kl_lower_bounds_are_tight():
+    rng = np.random.RandomState(0)
+    n = rng.randint(1, 100, 1000)
+    p = rng.randint(0, n + 1) / n
+    kl_limit = rng.exponential(0.2, 1000)
+
+    lower_bounds = kl_lower_bounds(p, kl_limit)
+
+    # Feasible, below p and infeasible just below the bound.
+    assert np.all(bernoulli_kl(p, lower_bounds) <= kl_limit)
+    assert np.all(lower_bounds <= p)
+    below = np.maximum(lower_bounds - 1e-9, 0)
+    moved = below < lower_bounds
+    assert np.all(bernoulli_kl(p[moved], below[moved]) > kl_limit[moved])
+
+
+def test_kl_lower_bounds_edge_cases():
+    p = np.array([0, 0.5, 1, 1])
+    kl_limit = np.array([1, 0, 0.3, 2])
+
+    # The bound is 0 for p = 0 and p for kl_limit = 0. KL(1 || u) in bits is
+    # -log2(u), so the bound for p = 1 is 2 ** -kl_limit.
+    np.testing.assert_allclose(kl_lower_bounds(p, kl_limit),
+                               [0, 0.5, 2 ** -0.3, 0.25], atol=1e-11)